@@ -0,0 +1,51 @@
+"""
+p50 / p99 latency of featurize_email against text_features on a one row DataFrame, on
+generated emails.
+
+    python benchmark_featurize_email.py --nb-emails 2000
+
+Parsed bodies are cleared before every call, so that a repeated body is not served from cache.
+Needs the nltk punkt_tab (or punkt) data.
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from feature_engineering import featurize_email, email_featurizer, text_features
+from html_utils import clear_parsed_bodies_cache
+from synthetic_emails import random_emails
+
+def latencies(function, rows):
+    milliseconds = []
+    for row in rows:
+        clear_parsed_bodies_cache()
+        start = time.perf_counter()
+        function(*row)
+        milliseconds.append((time.perf_counter() - start) * 1000)
+    return np.array(milliseconds)
+
+def one_row_text_features(templated_body, templated_object, company_name):
+    return text_features(pd.DataFrame({
+        'templated_body': [templated_body], 'templated_object': [templated_object], 'company_name': [company_name],
+        'company_name_lower': [company_name.lower() if company_name is not None else None]
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nb-emails', type=int, default=2000)
+    args = parser.parse_args()
+
+    df = random_emails(args.nb_emails)
+    rows = list(zip(df['templated_body'], df['templated_object'], df['company_name']))
+    # Warm caches : compiled regexps, tokenizer, lexicon, company matcher
+    start = time.perf_counter()
+    email_featurizer()
+    featurize_email(*rows[0])
+    print(f"{args.nb_emails} emails, first featurize_email call : {(time.perf_counter() - start) * 1000:.0f} ms")
+    print(f"{'':>20} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, function in [('featurize_email', featurize_email), ('1 row text_features', one_row_text_features)]:
+        milliseconds = latencies(function, rows)
+        print(f"{name:>20} {np.percentile(milliseconds, 50):>8.2f} {np.percentile(milliseconds, 99):>8.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Load time and peak memory of load_emails_inbox_dataframe on a generated emails TSV.
+
+    python benchmark_loaders.py --nb-emails 10000000 --path /tmp/emails.tsv
+
+Every loader runs in a fresh process, its peak RSS is the process one (imports included).
+'baseline' is the former loader : every column with inferred dtypes and row by row strptime.
+"""
+import os
+import time
+import datetime
+import resource
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from process_dataframe import load_emails_inbox_dataframe, DEFAULT_CSV_ENGINE
+from synthetic_emails import write_emails_tsv
+
+LOADERS = ['baseline', 'c', 'c-chunked', 'pyarrow']
+CHUNK_SIZE = 1000000
+
+def baseline_load(path):
+    df = pd.read_csv(path, sep='\t')
+    for col in ['created_at', 'updated_at']:
+        df[col] = df[col].apply(lambda x: datetime.datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f'))
+    return df
+
+def run_loader(path, loader):
+    start = time.perf_counter()
+    if loader == 'baseline':
+        df = baseline_load(path)
+    elif loader == 'c-chunked':
+        df = load_emails_inbox_dataframe(path, pd.Timestamp.min, pd.Timestamp.max, None, engine='c',
+                                         chunk_size=CHUNK_SIZE)
+    else:
+        df = load_emails_inbox_dataframe(path, pd.Timestamp.min, pd.Timestamp.max, None, engine=loader)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in KB on linux
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10, \
+        df.memory_usage(deep=True).sum() / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nb-emails', type=int, default=10000000)
+    parser.add_argument('--path', default='emails_benchmark.tsv')
+    parser.add_argument('--loaders', nargs='+', default=LOADERS, choices=LOADERS)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        write_emails_tsv(args.path, args.nb_emails)
+    print(f"{args.path} : {os.path.getsize(args.path) / 2**20:.0f} MB, default engine {DEFAULT_CSV_ENGINE}")
+    print(f"{'loader':>10} {'seconds':>9} {'peak MB':>9} {'frame MB':>9}")
+    for loader in args.loaders:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            seconds, peak_mb, frame_mb = executor.submit(run_loader, args.path, loader).result()
+        print(f"{loader:>10} {seconds:>9.2f} {peak_mb:>9.0f} {frame_mb:>9.0f}")
+
+if __name__ == '__main__':
+    main()
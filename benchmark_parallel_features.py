@@ -0,0 +1,52 @@
+"""
+Wall time of parallel_text_features from 1 to --max-jobs workers on generated emails.
+
+    python benchmark_parallel_features.py --nb-emails 5000 --max-jobs 8
+
+The chunk size defaults to nb_emails / max_jobs, so that every worker gets a chunk. A chunk
+size of at least nb_emails would run the serial path whatever the number of workers.
+"""
+import os
+import math
+import time
+import argparse
+from feature_engineering import parallel_text_features
+from html_utils import clear_parsed_bodies_cache
+from synthetic_emails import random_emails
+
+def benchmark(df, max_jobs, chunk_size, repeat):
+    timings = {}
+    for n_jobs in range(1, max_jobs + 1):
+        run_timings = []
+        for _ in range(repeat):
+            # Parsed bodies of a previous run would make the serial path look faster
+            clear_parsed_bodies_cache()
+            start = time.perf_counter()
+            parallel_text_features(df.copy(), n_jobs, chunk_size=chunk_size)
+            run_timings.append(time.perf_counter() - start)
+        timings[n_jobs] = min(run_timings)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nb-emails', type=int, default=2000)
+    parser.add_argument('--max-jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    if args.chunk_size is None:
+        args.chunk_size = math.ceil(args.nb_emails / args.max_jobs)
+    elif args.chunk_size >= args.nb_emails:
+        parser.error(f"--chunk-size {args.chunk_size} should be lower than --nb-emails {args.nb_emails}, "
+                     f"parallel_text_features runs serially otherwise")
+
+    df = random_emails(args.nb_emails, min_body_words=50, max_body_words=400, tags_ratio=0.1)
+    timings = benchmark(df, args.max_jobs, args.chunk_size, args.repeat)
+    print(f"{args.nb_emails} emails, chunk size {args.chunk_size}, {os.cpu_count()} cpus")
+    print(f"{'n_jobs':>6} {'seconds':>9} {'speedup':>8} {'efficiency':>10}")
+    for n_jobs, seconds in timings.items():
+        speedup = timings[1] / seconds
+        print(f"{n_jobs:>6} {seconds:>9.2f} {speedup:>8.2f} {speedup / n_jobs:>10.2f}")
+
+if __name__ == '__main__':
+    main()
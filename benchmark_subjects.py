@@ -0,0 +1,38 @@
+"""
+Reply / forward subject classification time of classify_subjects against the former joined
+regexp str.contains, on generated subjects.
+
+    python benchmark_subjects.py --nb-subjects 10000000
+"""
+import time
+import argparse
+from process_dataframe import classify_subjects, RESPONSE_PATTERNS
+from synthetic_emails import random_subjects
+
+def baseline_is_response(mail_objects):
+    # The former filter, run twice per clean_merged_emails_dataframe call
+    return mail_objects.str.contains('|'.join(RESPONSE_PATTERNS), case=False, na=False)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nb-subjects', type=int, default=10000000)
+    parser.add_argument('--nb-distinct', type=int, default=None,
+                        help="distinct subjects number, nb_subjects / 10 by default")
+    args = parser.parse_args()
+    nb_distinct = args.nb_distinct if args.nb_distinct is not None else max(args.nb_subjects // 10, 1)
+
+    mail_objects = random_subjects(args.nb_subjects, nb_distinct=nb_distinct)
+    start = time.perf_counter()
+    is_response = baseline_is_response(mail_objects)
+    regexp_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    labels = classify_subjects(mail_objects)
+    classify_seconds = time.perf_counter() - start
+
+    assert ((labels['subject_type'] != 'none').values == is_response.values).all()
+    print(f"{args.nb_subjects} subjects, {mail_objects.nunique()} distinct")
+    print(f"joined regexp str.contains : {regexp_seconds:.2f}s, twice in the former cleaning")
+    print(f"classify_subjects : {classify_seconds:.2f}s ({regexp_seconds / classify_seconds:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Import time, word regexp compile time and tokenization throughput of text_processor against
+the former emoji alternation regexp, on generated emails with emojis. Then cleaning throughput
+of process_batch against a tokenizer per document, on short generated bodies.
+
+    python benchmark_tokenizer.py --nb-texts 20000 --nb-short-texts 1000000
+
+The import is timed in a fresh interpreter, so that modules already imported here do not count.
+"""
+import sys
+import time
+import argparse
+import subprocess
+import regex as re
+from emoji import UNICODE_EMOJI
+import text_processor
+from text_processor import SocialMediaTokenizer, REGEXP_STRINGS, PUNCTUATION, tokens_types, word_regexp
+from synthetic_emails import random_emails, random_emoji_texts
+
+def baseline_word_regexp():
+    # The former module level WORD_REGEXP : an enclosing group and every emoji joined in a class
+    emojis = list(UNICODE_EMOJI.keys())
+    regexp_strings = dict(REGEXP_STRINGS, emoji='[(' + '|'.join(emojis[:1035] + emojis[1037:]) + ')]+')
+    return re.compile(r"""(%s)""" % "|".join(["(?P<{}>{})".format(i, v) for i, v in regexp_strings.items()]),
+                      re.VERBOSE | re.I | re.UNICODE)
+
+def baseline_tokenize(regexp, text):
+    # The former groupdict loop, with the default tokenizer options
+    tokens = []
+    for match in regexp.finditer(text):
+        token_dict = match.groupdict()
+        for token_type in tokens_types:
+            if token_dict[token_type] is not None:
+                if token_dict[token_type] in PUNCTUATION:
+                    tokens.append((token_dict[token_type], 'punctuation'))
+                    break
+                tokens.append((token_dict[token_type], token_type))
+                break
+    return tokens
+
+def baseline_process(regexp, text):
+    # The former per document cleaning : a tokenizer per text, its tokens from the groupdict loop
+    tokenizer = SocialMediaTokenizer(text)
+    tokenizer.tokens_ = baseline_tokenize(regexp, tokenizer.clean_text_)
+    tokenizer.process_text()
+    return tokenizer.clean_text_
+
+def per_document_process(text):
+    tokenizer = SocialMediaTokenizer(text)
+    tokenizer.tokenize()
+    tokenizer.process_text()
+    return tokenizer.clean_text_
+
+def import_seconds():
+    code = "import time; start = time.perf_counter(); import text_processor; print(time.perf_counter() - start)"
+    return float(subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nb-texts', type=int, default=20000)
+    parser.add_argument('--nb-short-texts', type=int, default=1000000)
+    args = parser.parse_args()
+
+    print(f"import text_processor : {import_seconds():.3f}s")
+    start = time.perf_counter()
+    baseline_regexp = baseline_word_regexp()
+    print(f"former word regexp compile : {time.perf_counter() - start:.3f}s")
+    word_regexp.cache_clear()
+    start = time.perf_counter()
+    word_regexp()
+    print(f"word_regexp compile : {time.perf_counter() - start:.3f}s, emoji class of "
+          f"{len(text_processor.EMOJI_STRING)} characters")
+
+    tokenizer = SocialMediaTokenizer()
+    texts = [tokenizer.normalize_text(text) for text in random_emoji_texts(args.nb_texts)]
+    megabytes = sum(len(text.encode()) for text in texts) / 2**20
+    start = time.perf_counter()
+    expected = [baseline_tokenize(baseline_regexp, text) for text in texts]
+    baseline_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    tokens = [list(tokenizer.iter_tokens(text)) for text in texts]
+    seconds = time.perf_counter() - start
+
+    assert tokens == expected
+    print(f"{args.nb_texts} texts, {megabytes:.1f} MB, {sum(map(len, tokens))} tokens")
+    print(f"former tokenize : {baseline_seconds:.2f}s, {megabytes / baseline_seconds:.1f} MB/s")
+    print(f"iter_tokens : {seconds:.2f}s, {megabytes / seconds:.1f} MB/s ({baseline_seconds / seconds:.1f}x)")
+
+    texts = list(random_emails(args.nb_short_texts, max_body_words=20)['templated_body'])
+    timings = {}
+    start = time.perf_counter()
+    expected = [baseline_process(baseline_regexp, text) for text in texts]
+    timings['former per document'] = time.perf_counter() - start
+    start = time.perf_counter()
+    per_document = [per_document_process(text) for text in texts]
+    timings['per document'] = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = tokenizer.process_batch(texts)
+    timings['process_batch'] = time.perf_counter() - start
+
+    assert batch == per_document == expected
+    print(f"{args.nb_short_texts} short texts")
+    for name, seconds in timings.items():
+        print(f"{name} : {seconds:.2f}s, {args.nb_short_texts / seconds:.0f} texts/s "
+              f"({timings['former per document'] / seconds:.1f}x)")
+
+if __name__ == '__main__':
+    main()
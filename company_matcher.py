@@ -0,0 +1,99 @@
+import re
+from functools import lru_cache
+
+SIMILARITY_CACHE_SIZE = 100000
+COMPANY_MATCHERS_CACHE_SIZE = 4096
+
+def levenshtein_distance(pattern_masks, pattern_length, token):
+    """
+    Bit-parallel (Myers / Hyyrö) Levenshtein distance between a precomputed pattern and a token.
+    pattern_masks maps each character to the bitmask of its positions in the pattern.
+    """
+    if pattern_length == 0:
+        return len(token)
+    mask = (1 << pattern_length) - 1
+    last_bit = 1 << (pattern_length - 1)
+    vp = mask
+    vn = 0
+    distance = pattern_length
+    for character in token:
+        eq = pattern_masks.get(character, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        ph = vn | ~(xh | vp)
+        mh = vp & xh
+        if ph & last_bit:
+            distance += 1
+        elif mh & last_bit:
+            distance -= 1
+        ph = (ph << 1) | 1
+        mh = mh << 1
+        vp = (mh | ~(xv | ph)) & mask
+        vn = ph & xv & mask
+    return distance
+
+class CompanyAlias(object):
+    def __init__(self, alias):
+        self.alias = alias
+        self.length = len(alias)
+        self.masks = {}
+        for i, character in enumerate(alias):
+            self.masks[character] = self.masks.get(character, 0) | (1 << i)
+
+    def similarity(self, token, levenshtein_th):
+        """
+        Same value as textdistance.levenshtein.normalized_similarity, None when the length
+        difference alone keeps it below levenshtein_th.
+        """
+        maximum = max(self.length, len(token))
+        if maximum == 0:
+            return 1
+        if 1 - abs(self.length - len(token)) / maximum < levenshtein_th:
+            return None
+        return 1 - levenshtein_distance(self.masks, self.length, token) / maximum
+
+class CompanyMatcher(object):
+    """
+    Occurences of a company in a text, matching any of its (lowercased) aliases.
+    Exact occurences are counted with the escaped aliases, fuzzy occurences sum the best
+    Levenshtein similarity of each token above levenshtein_th.
+    """
+    def __init__(self, aliases, levenshtein_th=0.3):
+        self.aliases = [CompanyAlias(alias) for alias in aliases]
+        self.levenshtein_th = levenshtein_th
+        # Longest aliases first, so that an alias contained in another one does not shadow it
+        self.regexp = re.compile('|'.join(re.escape(alias) for alias in sorted(aliases, key=len, reverse=True)))
+        self.similarities = {}
+
+    def token_similarity(self, token):
+        if token in self.similarities:
+            return self.similarities[token]
+        similarities = [alias.similarity(token, self.levenshtein_th) for alias in self.aliases]
+        similarity = max((s for s in similarities if s is not None), default=None)
+        if similarity is not None and similarity < self.levenshtein_th:
+            similarity = None
+        if len(self.similarities) >= SIMILARITY_CACHE_SIZE:
+            self.similarities.clear()
+        self.similarities[token] = similarity
+        return similarity
+
+    def nb_occurences(self, text):
+        return len(self.regexp.findall(text))
+
+    def levenshtein_occurence(self, text):
+        levenshtein_occurence = 0
+        for token in text.split(' '):
+            similarity = self.token_similarity(token)
+            if similarity is not None:
+                levenshtein_occurence += similarity
+        return levenshtein_occurence
+
+    def occurences(self, text):
+        return [self.nb_occurences(text), self.levenshtein_occurence(text)]
+
+@lru_cache(maxsize=COMPANY_MATCHERS_CACHE_SIZE)
+def company_matcher(aliases, levenshtein_th=0.3):
+    """
+    Shared matcher of a tuple of aliases, built once per company.
+    """
+    return CompanyMatcher(aliases, levenshtein_th=levenshtein_th)
@@ -0,0 +1,119 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import pandas as pd
+from process_dataframe import load_mailings_dataframe, load_threads_dataframe, load_emails_inbox_dataframe, \
+    merge_dataframes, clean_merged_emails_dataframe, INBOX_DEMO_MAILS, MIN_RESPONSE_TIME, RESPONSE_PATTERNS
+
+PARTITION_COLUMN = 'created_month'
+ROW_NUMBER_COLUMN = 'cache_row_number'
+MANIFEST_FILE = 'manifest.json'
+CACHE_KEY_LENGTH = 16
+CACHE_KEY_REGEXP = re.compile(f'[0-9a-f]{{{CACHE_KEY_LENGTH}}}')
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+def cache_manifest(mailings_path, threads_path, emails_inbox_path, start_datetime, end_datetime,
+                   strip_email_tags=False):
+    return {
+        'inputs': [file_fingerprint(path) for path in [mailings_path, threads_path, emails_inbox_path]],
+        'window': [str(start_datetime), str(end_datetime)],
+        'inbox_demo_mails': sorted(INBOX_DEMO_MAILS),
+        'min_response_time': MIN_RESPONSE_TIME,
+        'response_patterns': RESPONSE_PATTERNS,
+        'strip_email_tags': strip_email_tags
+    }
+
+def cache_key(manifest):
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode('utf-8')).hexdigest()[:CACHE_KEY_LENGTH]
+
+def read_manifest(entry_dir):
+    manifest_path = os.path.join(entry_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def invalidate_stale_entries(cache_dir, manifest, key):
+    # Same input files and window but another fingerprint : inputs or cleaning constants changed
+    # Other directories of cache_dir, in-flight '<key>.tmp' entries included, are left alone
+    input_paths = [fingerprint[0] for fingerprint in manifest['inputs']]
+    for entry in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, entry)
+        if entry == key or not CACHE_KEY_REGEXP.fullmatch(entry) or not os.path.isdir(entry_dir):
+            continue
+        entry_manifest = read_manifest(entry_dir)
+        if entry_manifest is None or \
+                ([fingerprint[0] for fingerprint in entry_manifest['inputs']] == input_paths and
+                 entry_manifest['window'] == manifest['window']):
+            logging.info(f"Removing stale cache entry {entry_dir}")
+            shutil.rmtree(entry_dir)
+
+def write_cache_entry(entry_dir, cleaned_df, mailings_df, manifest):
+    tmp_dir = entry_dir + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    cleaned_df = cleaned_df.copy()
+    cleaned_df[ROW_NUMBER_COLUMN] = range(len(cleaned_df))
+    cleaned_df[PARTITION_COLUMN] = cleaned_df['created_at'].dt.to_period('M').astype(str)
+    cleaned_df.to_parquet(os.path.join(tmp_dir, 'emails'), partition_cols=[PARTITION_COLUMN], index=False)
+    mailings_df.to_parquet(os.path.join(tmp_dir, 'mailings.parquet'), index=False)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f)
+
+    os.replace(tmp_dir, entry_dir)
+
+def read_cache_entry(entry_dir, columns=None, months=None):
+    if columns is not None:
+        columns = list(columns) + [ROW_NUMBER_COLUMN]
+    filters = [(PARTITION_COLUMN, 'in', list(months))] if months is not None else None
+    cleaned_df = pd.read_parquet(os.path.join(entry_dir, 'emails'), columns=columns, filters=filters, memory_map=True)
+    # Partitions come back month by month, restore the cleaned row order
+    cleaned_df.sort_values(ROW_NUMBER_COLUMN, inplace=True)
+    cleaned_df.drop([col for col in [ROW_NUMBER_COLUMN, PARTITION_COLUMN] if col in cleaned_df.columns],
+                    axis=1, inplace=True)
+    cleaned_df.reset_index(inplace=True, drop=True)
+    mailings_df = pd.read_parquet(os.path.join(entry_dir, 'mailings.parquet'), memory_map=True)
+
+    return cleaned_df, mailings_df
+
+def load_cleaned_emails_dataframe(mailings_path,
+                                  threads_path,
+                                  emails_inbox_path,
+                                  start_datetime,
+                                  end_datetime,
+                                  cache_dir,
+                                  columns=None,
+                                  months=None,
+                                  strip_email_tags=False,
+                                  **load_kwargs):
+    """
+    Cached load -> merge -> clean. months are 'YYYY-MM' created_at partitions to read.
+    """
+    manifest = cache_manifest(mailings_path, threads_path, emails_inbox_path, start_datetime, end_datetime,
+                              strip_email_tags)
+    key = cache_key(manifest)
+    entry_dir = os.path.join(cache_dir, key)
+    os.makedirs(cache_dir, exist_ok=True)
+    invalidate_stale_entries(cache_dir, manifest, key)
+
+    if read_manifest(entry_dir) is None:
+        logging.info(f"Cache miss, building {entry_dir}")
+        mailings_df = load_mailings_dataframe(mailings_path, start_datetime, end_datetime, **load_kwargs)
+        threads_df = load_threads_dataframe(threads_path, start_datetime, end_datetime, mailings_df['id'],
+                                            strip_email_tags=strip_email_tags, **load_kwargs)
+        emails_inbox_df = load_emails_inbox_dataframe(emails_inbox_path, start_datetime, end_datetime,
+                                                      threads_df['id'], **load_kwargs)
+        cleaned_df = clean_merged_emails_dataframe(merge_dataframes(emails_inbox_df, threads_df, mailings_df))
+        write_cache_entry(entry_dir, cleaned_df, mailings_df, manifest)
+    else:
+        logging.info(f"Cache hit {entry_dir}")
+
+    return read_cache_entry(entry_dir, columns=columns, months=months)
@@ -1,221 +1,489 @@
+import os
+import uuid
+import logging
+import resource
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import textstat
-from html_utils import MailObjectAnalyzer, MailBodyAnalyzer
+import pandas as pd
+from html_utils import MailObjectAnalyzer, MailBodyAnalyzer, CLEAN_TEXT_TOKENIZER, images_infos
+from text_readability import readability_metrics, readability_columns
+from company_matcher import company_matcher
+from instrumentation import Stage, instrumented, worker_function, worker_results
+from lexicon import LexiconVectorizer, lexicon_features, lexicon_feature_columns
 from textblob import TextBlob
-from collections import Counter
-import textdistance
 import re
 
-readability_metrics_functions = {
-    'flesch_reading_ease': textstat.flesch_reading_ease,
-    'flesch_kincaid_grade': textstat.flesch_kincaid_grade,
-    'coleman_liau_index': textstat.coleman_liau_index,
-    'automated_readability_index': textstat.automated_readability_index,
-    'dale_chall_readability_score': textstat.dale_chall_readability_score,
-    'difficult_words': textstat.difficult_words,
-    'linsear_write_formula': textstat.linsear_write_formula,
-    'gunning_fog': textstat.gunning_fog
-}
+SENTIMENT_COLUMNS = ['polarity_1', 'polarity_2', 'polarity_3', 'subjectivity_1', 'subjectivity_2', 'subjectivity_3',
+                     'max_polarity', 'max_subjectivity']
 
-first_person_pronouns = ['i', 'me', 'my', 'mine', 'myself']
-second_person_pronouns = ['you', 'your', 'yours', 'yourself', 'yourselves']
-first_person_plural_pronouns = ['we', 'us', 'our', 'ours', 'ourselves']
-third_person_plural_pronouns = ['they', 'them', 'their', 'theirs', 'themselves']
-third_person_pronouns = ['he', 'she', 'him', 'her', 'his', 'hers', 'himself', 'herself']
-
-def total_image_surface(images_infos):
-    total_surface = 0
-    for img_info in images_infos:
-        height, width = img_info['height'], img_info['width']
-        if height is not None and width is not None:
-            total_surface += height*width
-    return total_surface
-
-def custom_field_output(x):
-    fields = MailObjectAnalyzer(x, lower=True).extract_cutsom_fields()
-    if len(fields) != 0:
-        if fields[0] in ['{{influencer_name}}', '{{instagram_name}}']:
-            return fields[0]
-        else:
-            return "{{other}}"
-    else:
+TEMPLATE_COLUMNS = ['templated_body', 'templated_object', 'company_name']
+DEFAULT_CHUNK_SIZE = 5000
+
+MERGE_FIELD_REGEXP = re.compile("{{.*?}}")
+MERGE_FIELDS = ['{{influencer_name}}', '{{first_name}}', '{{instagram_name}}', '{{largest_social_media_type}}',
+                '{{instagram_followers}}', '{{application_link}}', '{{largest_social_media_name}}', '{{price}}']
+MERGE_FIELDS_POSITIONS = {field: i for i, field in enumerate(MERGE_FIELDS)}
+MERGE_FIELDS_COLUMNS = [field[1:-1] for field in MERGE_FIELDS] + ['{other}']
+CUSTOM_FIELD_OUTPUTS = ['{{influencer_name}}', '{{instagram_name}}']
+CUSTOM_FIELD_CATEGORIES = CUSTOM_FIELD_OUTPUTS + ['{{other}}', '{{None}}']
+
+# Intermediate text columns, the largest of the features frame
+TEXT_INTERMEDIATE_COLUMNS = ['raw_text', 'raw_text_lower', 'clean_text', 'body_text', 'images_infos']
+
+def images_features(images_arrays):
+    """
+    Number of images and square root of their total surface for each email, from the
+    get_images_array records. Images without both dimensions do not count in the surface.
+    """
+    nb_images = np.array([len(images) for images in images_arrays], dtype=int)
+    if nb_images.sum() == 0:
+        return nb_images, np.zeros(len(images_arrays))
+    images = np.concatenate(images_arrays)
+    surfaces = np.nan_to_num(images['width'] * images['height'])
+    emails = np.repeat(np.arange(len(images_arrays)), nb_images)
+    return nb_images, np.sqrt(np.bincount(emails, weights=surfaces, minlength=len(images_arrays)))
+
+def merge_fields_features(texts):
+    """
+    {{...}} fields of each text in one pass : boolean matrix of the MERGE_FIELDS plus an
+    "other fields" column, number of fields and first field (None without fields).
+    """
+    rows, fields = [], []
+    for i, text in enumerate(texts):
+        text_fields = MERGE_FIELD_REGEXP.findall(text)
+        rows.extend([i] * len(text_fields))
+        fields.extend(text_fields)
+    rows = np.array(rows, dtype=int)
+    fields = np.array(fields, dtype=object)
+
+    codes = pd.Categorical(fields, categories=MERGE_FIELDS).codes.astype(int)
+    codes[codes < 0] = len(MERGE_FIELDS)
+    fields_matrix = np.zeros((len(texts), len(MERGE_FIELDS) + 1), dtype=bool)
+    fields_matrix[rows, codes] = True
+
+    first_fields = np.full(len(texts), None, dtype=object)
+    fields_rows, first_positions = np.unique(rows, return_index=True)
+    first_fields[fields_rows] = fields[first_positions]
+
+    return fields_matrix, np.bincount(rows, minlength=len(texts)), first_fields
+
+def text_merge_fields(text):
+    """
+    merge_fields_features of a single text, without the batch overhead.
+    """
+    fields = MERGE_FIELD_REGEXP.findall(text)
+    fields_row = np.zeros(len(MERGE_FIELDS) + 1, dtype=bool)
+    for field in fields:
+        fields_row[MERGE_FIELDS_POSITIONS.get(field, len(MERGE_FIELDS))] = True
+    return fields_row, len(fields), fields[0] if fields else None
+
+def custom_field_from_first_field(first_field):
+    if first_field is None:
         return '{{None}}'
-    
-def readability_metrics(text_serie):
-    results = text_serie.agg(list(readability_metrics_functions.values()))
-    return results
-
-def pronoun_metrics(text):
-    results = []
-    zen = TextBlob(text)
-    words = zen.words
-    counter_words = Counter(words)
-    
-    nb_i = 0
-    nb_we = 0
-    nb_we_and_i = 0
-    nb_he = 0
-    nb_they = 0
-    nb_he_and_they = 0
-    nb_you = 0
-    
-    for p in first_person_pronouns:
-        if p in counter_words:
-            nb_i += counter_words[p]
-            nb_we_and_i += counter_words[p]
-    
-    for p in first_person_plural_pronouns:
-        if p in counter_words:
-            nb_we += counter_words[p]
-            nb_we_and_i += counter_words[p]
-            
-    for p in third_person_pronouns:
-        if p in counter_words:
-            nb_he += counter_words[p]
-            nb_we_and_i += counter_words[p]
-            
-    for p in second_person_pronouns:
-        if p in counter_words:
-            nb_you += counter_words[p]
-            
-    ratio_you_we = nb_you / nb_we if nb_we != 0 else nb_you
-    ratio_you_i = nb_you / nb_i if nb_i != 0 else nb_you
-    ratio_you_first = nb_you / nb_we_and_i if nb_we_and_i != 0 else nb_you
-            
-    return [nb_i, nb_we, nb_we_and_i, nb_he, nb_they, nb_he_and_they, nb_you, ratio_you_we, ratio_you_i, ratio_you_first]
+    first_field = first_field.lower()
+    return first_field if first_field in CUSTOM_FIELD_OUTPUTS else '{{other}}'
+
+def custom_fields_from_first_fields(first_fields):
+    first_fields = pd.Series(first_fields, dtype=object).str.lower()
+    outputs = first_fields.where(first_fields.isin(CUSTOM_FIELD_OUTPUTS), '{{other}}')
+    return outputs.where(first_fields.notna(), '{{None}}').values
+
+class TextAnalysis(object):
+    """
+    Sentences of a text segmented once, then shared by the sentence count and sentiment
+    features.
+    """
+    def __init__(self, text):
+        self.blob = TextBlob(text)
+        self.sentences_sentiments = [sentence.sentiment[:2] for sentence in self.blob.sentences]
+
+    def nb_sentences(self):
+        return len(self.sentences_sentiments)
+
+    def sentiment_features(self, nb_first=3):
+        first_sentences = self.sentences_sentiments[:nb_first]
+        padding = [0] * (nb_first - len(first_sentences))
+        polarities = [polarity for polarity, _ in first_sentences] + padding
+        subjectivities = [subjectivity for _, subjectivity in first_sentences] + padding
+        max_polarity = max([polarity for polarity, _ in self.sentences_sentiments], default=0)
+        max_subjectivity = max([subjectivity for _, subjectivity in self.sentences_sentiments], default=0)
+
+        return polarities + subjectivities + [max_polarity, max_subjectivity]
+
+    def overall_sentiment(self):
+        sentiment = self.blob.sentiment
+        return [sentiment.polarity, sentiment.subjectivity]
+
+    def features(self):
+        return [self.nb_sentences()] + self.sentiment_features() + self.overall_sentiment()
 
 def sentiment_analyzer(text, nb_first=3):
-    blob = TextBlob(text)
-    polarities = []
-    subjectivities = []
-    for sentence in blob.sentences[:nb_first]:
-        polarities.append(sentence.polarity)
-        subjectivities.append(sentence.subjectivity)
-    while len(subjectivities) < nb_first:
-        subjectivities.append(0)
-    while len(polarities) < nb_first:
-        polarities.append(0)
-    max_polarity = max([sentence.polarity for sentence in blob.sentences])
-    max_subjectivity = max([sentence.subjectivity for sentence in blob.sentences])
-    
-    return polarities + subjectivities + [max_polarity, max_subjectivity]
+    return TextAnalysis(text).sentiment_features(nb_first)
 
 def company_occurences(raw_text_lower, company_name_lower, levenshtein_th=0.3):
     if company_name_lower is None:
         return 0, 0
-    nb_occurences = len(re.findall(company_name_lower, raw_text_lower))
-    # Make better processing for text
-    levensthein_metrics = \
-        np.array(
-            [textdistance.levenshtein.normalized_similarity(company_name_lower, tk) for tk in raw_text_lower.split(' ')]
-        )
-    levensthein_occurence = sum(levensthein_metrics[levensthein_metrics >= levenshtein_th])
-    return [nb_occurences, levensthein_occurence]
-
-def extract_infos_from_html(df, user_id_to_company_id, company_id_to_name):
-    df['raw_text'] = df['templated_body'].apply(
-        lambda x: MailBodyAnalyzer(x, lower=False).get_raw_text()
-    )
-    df = df[df['raw_text'] != '']
-    df.reset_index(inplace=True, drop=True)
-    df['raw_text_lower'] = df['raw_text'].apply(lambda x: x.lower())
-    df['clean_text'] = df['raw_text_lower'].apply(lambda x: MailBodyAnalyzer(x, lower=True).get_clean_text())
-    df['nb_tokens_object'] = \
-        df['templated_object'].apply(
-            lambda x: len(MailObjectAnalyzer(x, lower=True).get_clean_tokens()))
-
-    df['object_length'] = \
-        df['templated_object'].apply(lambda x: MailObjectAnalyzer(x, lower=True).len_str())
-
-    df['nb_custom_fields_object'] = \
-        df['templated_object'].apply(
-            lambda x: len(MailObjectAnalyzer(x, lower=True).extract_cutsom_fields()))
-    df['has_fields_object'] = df['nb_custom_fields_object'] > 0
-
-    df['custom_fields'] = df['templated_object'].apply(lambda x: custom_field_output(x))
-
-    df['body_text'] = df['templated_body'].apply(lambda x: MailBodyAnalyzer(x, lower=True).get_clean_tokens())
-    df['body_text'] = df['body_text'].apply(lambda x: ' '.join(x))
-
-    df['nb_tokens_body'] = \
-    df['templated_body'].apply(lambda x: len(MailBodyAnalyzer(x, lower=False).get_clean_tokens()))
-
-    df['body_length'] = df['body_text'].apply(len)
-    df['html_body_length'] = df['templated_body'].apply(len)
-    df['nb_html_tags_body'] = df['templated_body'].apply(lambda x: MailBodyAnalyzer(x, lower=False).get_tags_number())
-
-    df['body_custom_fields'] = \
-    df['templated_body'].apply(lambda x: MailBodyAnalyzer(x, lower=False).extract_cutsom_fields())
-
-    selected_fields = ['{{influencer_name}}', '{{first_name}}', '{{instagram_name}}', '{{largest_social_media_type}}',
-                       '{{instagram_followers}}', '{{application_link}}', '{{largest_social_media_name}}', '{{price}}']
-
-    for field in selected_fields:
-        df['body_' + field[1:-1]] = df['body_custom_fields'].apply(lambda x: field in x)
-
-    df['nb_custom_fields_body'] = df['body_custom_fields'].apply(lambda x: len(x))
-    df['has_fields_body'] = df['nb_custom_fields_body'] > 0
-    
-    df['object_custom_fields'] = \
-    df['templated_object'].apply(lambda x: MailObjectAnalyzer(x, lower=False).extract_cutsom_fields())
-
-    selected_fields = ['{{influencer_name}}', '{{first_name}}', '{{instagram_name}}', '{{largest_social_media_type}}',
-                       '{{instagram_followers}}', '{{application_link}}', '{{largest_social_media_name}}', '{{price}}']
-
-    for field in selected_fields:
-        df['object_' + field[1:-1]] = df['object_custom_fields'].apply(lambda x: field in x)
-
-    df['nb_custom_fields_object'] = df['object_custom_fields'].apply(lambda x: len(x))
-    df['has_fields_object'] = df['nb_custom_fields_object'] > 0
-
-    df['images_infos'] = df['templated_body'].apply(lambda x:
-                                                    MailBodyAnalyzer(x,
-                                                                     lower=True,
-                                                                     asyncio_loop=None,
-                                                                     img_size_url_finder=False).get_images_infos())
-    df['nb_images'] = df['images_infos'].apply(len)
-    df['total_images_surface_norm'] = df['images_infos'].apply(total_image_surface).apply(np.sqrt)
-    
-    r_metrics_body = readability_metrics(df['raw_text'])
-    for col in r_metrics_body.columns:
-        df[f'{col}_body'] = r_metrics_body[col]
-
-    r_metrics_object = readability_metrics(df['raw_text'])
-    for col in r_metrics_object.columns:
-        df[f'{col}_object'] = r_metrics_object[col]
-        
-    df['nb_sentences'] = df['raw_text'].apply(lambda x: len(TextBlob(x).sentences))
-    
-    pronoun_columns = ['nb_i', 'nb_we', 'nb_we_and_i', 'nb_he', 'nb_they', 'nb_he_and_they', 'nb_you', 'ratio_you_we', 'ratio_you_i', 'ratio_you_first']
-    for col in pronoun_columns:
-        df[col] = 0
-    
-    processed_data = df['raw_text_lower'].apply(lambda x: pronoun_metrics(x))
-    processed_data = np.array([np.array(i) for i in processed_data.values])
-    df[pronoun_columns] = processed_data
-    
-    df['currency'] = df['raw_text'].apply(lambda x: '$' in x or '£' in x or '€' in x)
-    
-    sentiment_data = np.array(list(df['raw_text'].apply(sentiment_analyzer).values))
-    sentiment_features = ['polarity_1', 'polarity_2', 'polarity_3', 'subjectivity_1', 'subjectivity_2', 'subjectivity_3',
-                          'max_polarity', 'max_subjectivity']
-    for id_sentiment, sent in enumerate(sentiment_features):
-        df[sent] = sentiment_data[:, id_sentiment]
-        
-    df['overall_polarity'] = df['raw_text'].apply(lambda x: TextBlob(x).sentiment.polarity)
-    df['overall_subjectivity'] = df['raw_text'].apply(lambda x: TextBlob(x).sentiment.subjectivity)
-        
+    aliases = (company_name_lower,) if isinstance(company_name_lower, str) else tuple(company_name_lower)
+    return company_matcher(aliases, levenshtein_th).occurences(raw_text_lower)
+
+def add_company_columns(df, user_id_to_company_id, company_id_to_name):
     df['company_id'] = df['created_by'].apply(lambda x: user_id_to_company_id[x] if x in user_id_to_company_id else None)
     df['company_name'] = df['company_id'].apply(lambda x: company_id_to_name[x] if not np.isnan(x) else None)
     df['company_name_lower'] = df['company_name'].apply(lambda x: x.lower() if x is not None else None)
-    company_occurences_data = np.array(
-        list(
-            df[['body_text', 'company_name_lower']].apply(lambda x: company_occurences(x[0], x[1]), axis=1).values
-        )
-    )
-    df['nb_occurences'] = company_occurences_data[:, 0]
-    df['levensthein_occurence'] = company_occurences_data[:, 1]
-    
-    df['influencer_company_ratio'] = (df['nb_we_and_i'] + df['nb_occurences']) / (df['nb_you'] + df['nb_custom_fields_body'])
-    
-    return df
\ No newline at end of file
+    return df
+
+def log_peak_rss(stage):
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        # ru_maxrss is in KB on Linux
+        peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        logging.info(f"Peak RSS after {stage} : {peak_rss / 2**10:.1f} MB")
+
+def downcast_features(df, columns):
+    for col in columns:
+        dtype = df[col].dtype
+        if dtype == np.float64:
+            df[col] = df[col].astype(np.float32)
+        elif dtype == np.int64:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    if 'custom_fields' in columns:
+        df['custom_fields'] = pd.Categorical(df['custom_fields'], categories=CUSTOM_FIELD_CATEGORIES)
+    return df
+
+def spill_text_columns(df, spill_dir):
+    """
+    Write the text intermediates with the row keys to a new parquet file of spill_dir.
+    """
+    os.makedirs(spill_dir, exist_ok=True)
+    keys = [col for col in ['id', 'template_key'] if col in df.columns]
+    df[keys + TEXT_INTERMEDIATE_COLUMNS].to_parquet(
+        os.path.join(spill_dir, f'text_columns-{uuid.uuid4().hex}.parquet'), index=False)
+
+def drop_consumed_columns(df, columns, compact):
+    """
+    With compact, text intermediates are dropped as soon as no later stage reads them.
+    """
+    if compact:
+        df.drop(columns, axis=1, inplace=True)
+
+def read_spilled_text_columns(spill_dir, columns=None):
+    return pd.read_parquet(spill_dir, columns=columns)
+
+def template_keys(df):
+    return pd.util.hash_pandas_object(df[TEMPLATE_COLUMNS], index=False)
+
+def mail_body_features(templated_bodies, image_sizes=None):
+    """
+    Everything text_features reads from the html bodies, in one loop parsing each body once:
+    dict of lists of raw_text, body_text, nb_tokens_body, nb_html_tags_body, images_infos and
+    images arrays.
+    """
+    features = {'raw_text': [], 'body_text': [], 'nb_tokens_body': [], 'nb_html_tags_body': [],
+                'images_infos': [], 'images_arrays': []}
+    for templated_body in templated_bodies:
+        analyzer = MailBodyAnalyzer(templated_body, lower=False, image_sizes=image_sizes)
+        lower_analyzer = MailBodyAnalyzer(templated_body, lower=True, image_sizes=image_sizes,
+                                          document=analyzer.document)
+        features['raw_text'].append(analyzer.get_raw_text())
+        features['body_text'].append(' '.join(lower_analyzer.get_clean_tokens()))
+        features['nb_tokens_body'].append(len(analyzer.get_clean_tokens()))
+        features['nb_html_tags_body'].append(analyzer.get_tags_number())
+        images = lower_analyzer.get_images_array()
+        features['images_arrays'].append(images)
+        features['images_infos'].append(images_infos(images))
+    return features
+
+def text_features(df, image_sizes=None, compact=False, spill_dir=None):
+    input_columns = set(df.columns)
+    with Stage('raw_text', df) as stage:
+        body_features = mail_body_features(df['templated_body'], image_sizes)
+        has_text = np.array([raw_text != '' for raw_text in body_features['raw_text']], dtype=bool)
+        body_features = {name: [value for value, keep in zip(values, has_text) if keep]
+                         for name, values in body_features.items()}
+        df = df[has_text]
+        df.reset_index(inplace=True, drop=True)
+        df['raw_text'] = body_features['raw_text']
+        df['raw_text_lower'] = df['raw_text'].apply(lambda x: x.lower())
+        stage.rows_out = len(df)
+
+    with Stage('clean_text', df):
+        df['clean_text'] = CLEAN_TEXT_TOKENIZER.process_batch(list(df['raw_text_lower']))
+
+    with Stage('object_features', df):
+        df['nb_tokens_object'] = \
+            df['templated_object'].apply(
+                lambda x: len(MailObjectAnalyzer(x, lower=True).get_clean_tokens()))
+
+        df['object_length'] = \
+            df['templated_object'].apply(lambda x: MailObjectAnalyzer(x, lower=True).len_str())
+
+        object_texts = df['templated_object'].apply(lambda x: str(MailObjectAnalyzer(x)))
+        object_fields, nb_object_fields, first_object_fields = merge_fields_features(object_texts)
+        df['nb_custom_fields_object'] = nb_object_fields
+        df['has_fields_object'] = nb_object_fields > 0
+
+        df['custom_fields'] = custom_fields_from_first_fields(first_object_fields)
+
+    with Stage('body_features', df):
+        df['body_text'] = body_features['body_text']
+        df['nb_tokens_body'] = body_features['nb_tokens_body']
+        df['body_length'] = df['body_text'].apply(len)
+        df['html_body_length'] = df['templated_body'].apply(len)
+        df['nb_html_tags_body'] = body_features['nb_html_tags_body']
+
+    with Stage('merge_fields', df):
+        body_fields, nb_body_fields, _ = merge_fields_features(df['raw_text'])
+        for i, column in enumerate(MERGE_FIELDS_COLUMNS):
+            df['body_' + column] = body_fields[:, i]
+        df['nb_custom_fields_body'] = nb_body_fields
+        df['has_fields_body'] = nb_body_fields > 0
+
+        for i, column in enumerate(MERGE_FIELDS_COLUMNS):
+            df['object_' + column] = object_fields[:, i]
+
+    with Stage('images', df):
+        df['images_infos'] = body_features['images_infos']
+        nb_images, total_images_surface_norm = images_features(body_features['images_arrays'])
+        df['nb_images'] = nb_images
+        df['total_images_surface_norm'] = total_images_surface_norm
+    del body_features
+    # Every text intermediate exists from here, they are spilled together before being dropped
+    if compact and spill_dir is not None:
+        spill_text_columns(df, spill_dir)
+    drop_consumed_columns(df, ['clean_text', 'images_infos'], compact)
+    log_peak_rss('html parsing')
+
+    with Stage('readability', df):
+        r_metrics_body = readability_metrics(df['raw_text'])
+        for col in r_metrics_body.columns:
+            df[f'{col}_body'] = r_metrics_body[col]
+
+        r_metrics_object = readability_metrics(object_texts)
+        for col in r_metrics_object.columns:
+            df[f'{col}_object'] = r_metrics_object[col]
+    log_peak_rss('readability metrics')
+
+    with Stage('sentiment', df):
+        text_analyses = np.array([TextAnalysis(x).features() for x in df['raw_text']], dtype=float)\
+            .reshape(len(df), 1 + len(SENTIMENT_COLUMNS) + 2)
+        df['nb_sentences'] = text_analyses[:, 0].astype(int)
+
+        for id_sentiment, sent in enumerate(SENTIMENT_COLUMNS):
+            df[sent] = text_analyses[:, 1 + id_sentiment]
+
+        df['overall_polarity'] = text_analyses[:, -2]
+        df['overall_subjectivity'] = text_analyses[:, -1]
+    drop_consumed_columns(df, ['raw_text'], compact)
+    log_peak_rss('sentiment analysis')
+
+    with Stage('lexicon', df):
+        vectorizer = LexiconVectorizer()
+        lexicon_df = lexicon_features(vectorizer.class_counts(vectorizer.transform(df['raw_text_lower'])))
+        for col in lexicon_df.columns:
+            df[col] = lexicon_df[col].values
+        df['currency'] = df['nb_currency'] > 0
+    drop_consumed_columns(df, ['raw_text_lower'], compact)
+
+    with Stage('company_occurences', df):
+        company_occurences_data = np.array(
+            list(
+                df[['body_text', 'company_name_lower']].apply(lambda x: company_occurences(x[0], x[1]), axis=1).values
+            ),
+            dtype=float
+        ).reshape(-1, 2)
+        df['nb_occurences'] = company_occurences_data[:, 0]
+        df['levensthein_occurence'] = company_occurences_data[:, 1]
+
+        df['influencer_company_ratio'] = (df['nb_we_and_i'] + df['nb_occurences']) / (df['nb_you'] + df['nb_custom_fields_body'])
+    drop_consumed_columns(df, ['body_text'], compact)
+
+    if compact:
+        with Stage('compaction', df):
+            df = downcast_features(df, [col for col in df.columns if col not in input_columns])
+        log_peak_rss('compaction')
+
+    return df
+
+def text_chunks(df, chunk_size):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size].reset_index(drop=True)
+
+@instrumented()
+def parallel_text_features(df, n_jobs, chunk_size=DEFAULT_CHUNK_SIZE, **features_kwargs):
+    if len(df) <= chunk_size:
+        return text_features(df, **features_kwargs)
+    if n_jobs == 1:
+        if not features_kwargs.get('compact', False):
+            return text_features(df, **features_kwargs)
+        # Compacted chunks one at a time, the text intermediates of a single chunk are alive at once
+        return pd.concat([text_features(chunk, **features_kwargs) for chunk in text_chunks(df, chunk_size)],
+                         ignore_index=True)
+    chunks = list(text_chunks(df, chunk_size))
+    # map keeps the chunks order, so rows come back exactly as in the serial path
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        features_chunks = worker_results(
+            executor.map(worker_function(partial(text_features, **features_kwargs)), chunks))
+    df = pd.concat(features_chunks, ignore_index=True)
+    return df
+
+@instrumented()
+def template_features(df, n_jobs=1, chunk_size=DEFAULT_CHUNK_SIZE, **features_kwargs):
+    """
+    Features of each distinct template_key of df, one row per template.
+    """
+    templates_df = df[['template_key'] + TEMPLATE_COLUMNS + ['company_name_lower']].drop_duplicates('template_key')
+    templates_df.reset_index(inplace=True, drop=True)
+    logging.info(f"Template deduplication ratio : {len(df) / max(len(templates_df), 1):.2f} "
+                 f"({len(templates_df)} templates for {len(df)} emails)")
+
+    features_df = parallel_text_features(templates_df, n_jobs, chunk_size, **features_kwargs)
+    features_df.drop(TEMPLATE_COLUMNS + ['company_name_lower'], axis=1, inplace=True)
+
+    return features_df
+
+@instrumented()
+def join_template_features(df, features_df):
+    positions = pd.Index(features_df['template_key']).get_indexer(df['template_key'])
+    # Templates with an empty raw text were filtered out, as are their emails
+    df = df[positions >= 0]
+    df.reset_index(inplace=True, drop=True)
+    features_df = features_df.drop(['template_key'], axis=1).take(positions[positions >= 0])
+    features_df.reset_index(inplace=True, drop=True)
+
+    return pd.concat([df, features_df], axis=1)
+
+@instrumented()
+def extract_infos_from_html(df,
+                            user_id_to_company_id,
+                            company_id_to_name,
+                            deduplicate_templates=False,
+                            n_jobs=1,
+                            chunk_size=DEFAULT_CHUNK_SIZE,
+                            image_sizes=None,
+                            compact=False,
+                            spill_dir=None):
+    """
+    image_sizes is the url -> (width, height) dict of image_probe.probe_image_sizes, used for
+    the images without width or height attributes.
+    compact drops the text intermediates (raw_text, clean_text, ...) and downcasts the features,
+    the intermediates are kept in parquet files of spill_dir if given (see read_spilled_text_columns).
+    """
+    df = add_company_columns(df, user_id_to_company_id, company_id_to_name)
+    df['template_key'] = template_keys(df)
+    features_kwargs = {'image_sizes': image_sizes, 'compact': compact, 'spill_dir': spill_dir}
+    if not deduplicate_templates:
+        df = parallel_text_features(df, n_jobs, chunk_size, **features_kwargs)
+    else:
+        df = join_template_features(df, template_features(df, n_jobs, chunk_size, **features_kwargs))
+    log_peak_rss('features extraction')
+
+    return df
+
+WARM_UP_EMAIL = {
+    'templated_body': '<p>Hi {{first_name}},</p><p>We love your work. I think you would like our brand, '
+                      'click here to apply! It is $20.</p><img src="logo.png" width="10" height="10">',
+    'templated_object': 'Collaboration with {{influencer_name}}',
+    'company_name': 'Brand'
+}
+
+class EmailFeaturizer(object):
+    """
+    Features of one email at a time for online scoring, without building a DataFrame. Values and
+    column order are the ones of text_features, built once so that compiled regexps, tokenizer,
+    syllables cache and company matchers stay warm between calls.
+    """
+    def __init__(self):
+        self.lexicon_vectorizer = LexiconVectorizer()
+        # The batch path on a warm up email gives the columns order and loads the caches
+        warm_up_df = pd.DataFrame([WARM_UP_EMAIL])
+        warm_up_df['company_name_lower'] = warm_up_df['company_name'].str.lower()
+        input_columns = set(warm_up_df.columns)
+        self.columns = [col for col in text_features(warm_up_df).columns
+                        if col not in input_columns and col not in TEXT_INTERMEDIATE_COLUMNS]
+
+    def features(self, templated_body, templated_object, company_name=None, image_sizes=None):
+        """
+        dict of the features, None when the body has no text (filtered out by the batch path).
+        """
+        raw_text = MailBodyAnalyzer(templated_body, lower=False).get_raw_text()
+        if raw_text == '':
+            return None
+        raw_text_lower = raw_text.lower()
+        features = {}
+
+        features['nb_tokens_object'] = len(MailObjectAnalyzer(templated_object, lower=True).get_clean_tokens())
+        features['object_length'] = MailObjectAnalyzer(templated_object, lower=True).len_str()
+        object_text = str(MailObjectAnalyzer(templated_object))
+        object_fields, nb_object_fields, first_object_field = text_merge_fields(object_text)
+        features['nb_custom_fields_object'] = nb_object_fields
+        features['has_fields_object'] = nb_object_fields > 0
+        features['custom_fields'] = custom_field_from_first_field(first_object_field)
+
+        body_text = ' '.join(MailBodyAnalyzer(templated_body, lower=True).get_clean_tokens())
+        features['nb_tokens_body'] = len(MailBodyAnalyzer(templated_body, lower=False).get_clean_tokens())
+        features['body_length'] = len(body_text)
+        features['html_body_length'] = len(templated_body)
+        features['nb_html_tags_body'] = MailBodyAnalyzer(templated_body, lower=False).get_tags_number()
+
+        body_fields, nb_body_fields, _ = text_merge_fields(raw_text)
+        for i, column in enumerate(MERGE_FIELDS_COLUMNS):
+            features['body_' + column] = body_fields[i]
+            features['object_' + column] = object_fields[i]
+        features['nb_custom_fields_body'] = nb_body_fields
+        features['has_fields_body'] = nb_body_fields > 0
+
+        images_analyzer = MailBodyAnalyzer(templated_body, lower=True, image_sizes=image_sizes)
+        nb_images, total_images_surface_norm = images_features([images_analyzer.get_images_array()])
+        features['nb_images'] = nb_images[0]
+        features['total_images_surface_norm'] = total_images_surface_norm[0]
+
+        metrics = readability_columns([raw_text, object_text])
+        for col, values in metrics.items():
+            features[f'{col}_body'] = values[0]
+            features[f'{col}_object'] = values[1]
+
+        text_analysis = TextAnalysis(raw_text).features()
+        features['nb_sentences'] = int(text_analysis[0])
+        for id_sentiment, sent in enumerate(SENTIMENT_COLUMNS):
+            features[sent] = text_analysis[1 + id_sentiment]
+        features['overall_polarity'] = text_analysis[-2]
+        features['overall_subjectivity'] = text_analysis[-1]
+
+        vectorizer = self.lexicon_vectorizer
+        class_counts = vectorizer.class_counts_array(vectorizer.transform([raw_text_lower]))
+        for col, values in lexicon_feature_columns(class_counts, list(vectorizer.lexicon)).items():
+            features[col] = values[0]
+        features['currency'] = features['nb_currency'] > 0
+
+        company_name_lower = company_name.lower() if company_name is not None else None
+        nb_occurences, levensthein_occurence = company_occurences(body_text, company_name_lower)
+        features['nb_occurences'] = float(nb_occurences)
+        features['levensthein_occurence'] = float(levensthein_occurence)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features['influencer_company_ratio'] = \
+                np.float64(features['nb_we_and_i'] + features['nb_occurences']) / \
+                (features['nb_you'] + features['nb_custom_fields_body'])
+
+        return features
+
+    def __call__(self, templated_body, templated_object, company_name=None, image_sizes=None):
+        features = self.features(templated_body, templated_object, company_name, image_sizes)
+        if features is None:
+            return None
+        return [features[col] for col in self.columns]
+
+_email_featurizer = None
+
+def email_featurizer():
+    global _email_featurizer
+    if _email_featurizer is None:
+        _email_featurizer = EmailFeaturizer()
+    return _email_featurizer
+
+def featurize_email(templated_body, templated_object, company_name=None, image_sizes=None):
+    """
+    Feature vector of one email, in the order of email_featurizer().columns (the text_features
+    columns). None when the body has no text.
+    """
+    return email_featurizer()(templated_body, templated_object, company_name, image_sizes)
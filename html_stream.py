@@ -0,0 +1,136 @@
+import re
+from collections import Counter
+from html.parser import HTMLParser
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+
+# BeautifulSoup html.parser tree builder rules, see MailBodyEventsParser
+TAGS_TO_REMOVE = {'script', 'style'}
+STRING_CONTAINER_TAGS = {'rt', 'rp', 'style', 'script', 'template'}
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+EMPTY_ELEMENT_TAGS = {'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image',
+                      'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source',
+                      'spacer', 'track', 'wbr'}
+ASCII_SPACES = ' \n\t\x0c\r'
+DECIMAL_REFERENCE_REGEXP = re.compile('^([0-9]+)(.*)')
+HEX_REFERENCE_REGEXP = re.compile('^([0-9a-f]+)(.*)')
+
+class MailBodyEventsParser(HTMLParser):
+    """
+    html.parser events handled the way BeautifulSoup(features="html.parser") handles them,
+    without building a tree. Only what MailBodyAnalyzer needs is kept: the strings get_text
+    would return, the number of tags and the img attributes, script and style tags removed.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.strings = []
+        self.nb_tags = 0
+        self.images = []
+        self.current_data = []
+        self.tags_stack = []
+        self.open_tags_counter = Counter()
+        self.preserve_whitespace_depth = 0
+        # Depths of the open string container tags, their strings are not text
+        self.string_containers_stack = []
+        self.already_closed_empty_elements = []
+
+    def end_data(self, is_text=None):
+        if not self.current_data:
+            return
+        data = ''.join(self.current_data)
+        self.current_data = []
+        if not self.preserve_whitespace_depth and not data.strip(ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        if is_text is None:
+            is_text = not self.string_containers_stack
+        if is_text:
+            self.strings.append(data)
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self.end_data()
+        if tag not in TAGS_TO_REMOVE:
+            self.nb_tags += 1
+        if tag == 'img':
+            self.images.append({key: '' if value is None else value for key, value in attrs})
+        self.tags_stack.append(tag)
+        self.open_tags_counter[tag] += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace_depth += 1
+        if tag in STRING_CONTAINER_TAGS:
+            self.string_containers_stack.append(len(self.tags_stack))
+        if tag in EMPTY_ELEMENT_TAGS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed_empty_elements.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def pop_tag(self):
+        if self.string_containers_stack and self.string_containers_stack[-1] == len(self.tags_stack):
+            self.string_containers_stack.pop()
+        tag = self.tags_stack.pop()
+        self.open_tags_counter[tag] -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace_depth -= 1
+        return tag
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed_empty_elements:
+            self.already_closed_empty_elements.remove(tag)
+            return
+        self.end_data()
+        # Unmatched end tags are ignored, the others close every tag opened since
+        while self.open_tags_counter[tag] and self.pop_tag() != tag:
+            pass
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith(('x', 'X')):
+            name, base, regexp = name[1:], 16, HEX_REFERENCE_REGEXP
+        else:
+            base, regexp = 10, DECIMAL_REFERENCE_REGEXP
+        extra_data = ''
+        try:
+            codepoint = int(name, base)
+        except ValueError:
+            match = regexp.search(name)
+            if match is None:
+                self.handle_data('')
+                self.handle_data(name)
+                return
+            codepoint, extra_data = int(match.group(1), base), match.group(2)
+        self.handle_data(UnicodeDammit.numeric_character_reference(codepoint)[0])
+        self.handle_data(extra_data)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else '&%s' % name)
+
+    def handle_special_data(self, data, is_text):
+        self.end_data()
+        self.handle_data(data)
+        self.end_data(is_text)
+
+    def handle_comment(self, data):
+        self.handle_special_data(data, False)
+
+    def handle_decl(self, decl):
+        self.handle_special_data(decl, False)
+
+    def handle_pi(self, data):
+        self.handle_special_data(data, False)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self.handle_special_data(data[len('CDATA['):], True)
+        else:
+            self.handle_special_data(data, False)
+
+def stream_mail_body(mail_body):
+    parser = MailBodyEventsParser()
+    parser.feed(mail_body)
+    parser.close()
+    parser.end_data()
+    return parser
@@ -1,8 +1,58 @@
 import re
+import hashlib
+from collections import OrderedDict
 from bs4 import BeautifulSoup
-from fastimage.fastimage.detect import get_size
 import asyncio
+import numpy as np
 from text_processor import SocialMediaTokenizer
+from html_stream import stream_mail_body
+
+TAGS_TO_REMOVE = ['script', 'style']
+CLEAN_TEXT_TOKENIZER = SocialMediaTokenizer(specify_url_type=True)
+PARSED_BODIES_CACHE_SIZE = 1024
+# 'stream' gives the same results as 'soup' without building a BeautifulSoup tree
+DEFAULT_HTML_BACKEND = 'stream'
+
+# Pixel dimension ('100', '100px', ' 100.5 px;'), relative ones ('100%', 'auto') are unknown
+IMAGE_DIMENSION_REGEXP = re.compile(r'\s*(\d+(?:\.\d+)?)\s*(px|%)?', re.IGNORECASE)
+CSS_DIMENSION_REGEXP = re.compile(r'(?:^|;)\s*(width|height)\s*:\s*([^;]*)', re.IGNORECASE)
+IMAGE_INFO_DTYPE = np.dtype([('width', 'f8'), ('height', 'f8')])
+
+def parse_dimension(value):
+    if value is None:
+        return np.nan
+    match = IMAGE_DIMENSION_REGEXP.match(str(value))
+    if match is None or match.group(2) == '%':
+        return np.nan
+    return float(match.group(1))
+
+def image_source(img):
+    """
+    src of an img tag, or its first srcset candidate, with the candidate width descriptor.
+    """
+    src = img.get('src')
+    srcset = img.get('srcset')
+    if srcset is None or not srcset.strip():
+        return src, np.nan
+    candidate = srcset.split(',')[0].split()
+    width = np.nan
+    if len(candidate) > 1 and candidate[1].lower().endswith('w'):
+        width = parse_dimension(candidate[1][:-1])
+    return (src if src is not None else candidate[0]), width
+
+def image_dimensions(img):
+    """
+    (width, height) from the attributes, then from the inline style, NaN when unknown.
+    """
+    width, height = parse_dimension(img.get('width')), parse_dimension(img.get('height'))
+    style = img.get('style')
+    if style is not None and (np.isnan(width) or np.isnan(height)):
+        css_dimensions = {name.lower(): value for name, value in CSS_DIMENSION_REGEXP.findall(style)}
+        if np.isnan(width):
+            width = parse_dimension(css_dimensions.get('width'))
+        if np.isnan(height):
+            height = parse_dimension(css_dimensions.get('height'))
+    return width, height
 
 class MailObjectAnalyzer(object):
     def __init__(self,
@@ -31,24 +81,115 @@ class MailObjectAnalyzer(object):
     def extract_cutsom_fields(self):
         return re.findall("{{.*?}}", self.mail_object)
 
+class MailBodyDocument(object):
+    """
+    Parsed html document shared by every MailBodyAnalyzer built on the same body.
+    Results stored in memo are shared too and must not be mutated by callers.
+    """
+    def memoize(self, key, compute):
+        if key not in self.memo:
+            self.memo[key] = compute()
+        return self.memo[key]
+
+class ParsedMailBody(MailBodyDocument):
+    def __init__(self, mail_body):
+        self.soup = BeautifulSoup(mail_body, features="html.parser")
+        for tag in self.soup.find_all(TAGS_TO_REMOVE):
+            tag.extract()
+        self.memo = {}
+
+    def get_text(self):
+        return self.soup.get_text(' ')
+
+    def get_tags_number(self):
+        return len(self.soup.find_all())
+
+    def get_images(self):
+        return self.soup.findAll('img')
+
+class StreamedMailBody(MailBodyDocument):
+    """
+    Same text, tags number and images as ParsedMailBody, read in one pass over the parser
+    events without building a tree. The soup is only built if asked for.
+    """
+    def __init__(self, mail_body):
+        self.mail_body = mail_body
+        parser = stream_mail_body(mail_body)
+        self.text = ' '.join(parser.strings)
+        self.tags_number = parser.nb_tags
+        self.images = parser.images
+        self._soup = None
+        self.memo = {}
+
+    @property
+    def soup(self):
+        if self._soup is None:
+            self._soup = ParsedMailBody(self.mail_body).soup
+        return self._soup
+
+    def get_text(self):
+        return self.text
+
+    def get_tags_number(self):
+        return self.tags_number
+
+    def get_images(self):
+        return self.images
+
+HTML_BACKENDS = {'soup': ParsedMailBody, 'stream': StreamedMailBody}
+
+_parsed_bodies = OrderedDict()
+
+def images_infos(images):
+    """
+    width and height dicts of an images array, None for unknown dimensions.
+    """
+    return [{'width': None if np.isnan(width) else width, 'height': None if np.isnan(height) else height}
+            for width, height in images.tolist()]
+
+def parse_mail_body(mail_body, backend=DEFAULT_HTML_BACKEND):
+    if backend not in HTML_BACKENDS:
+        raise ValueError(f"Unknown html backend {backend}, should be one of {list(HTML_BACKENDS)}")
+    if type(mail_body) != str:
+        mail_body = ''
+    key = (backend, hashlib.blake2b(mail_body.encode('utf-8', 'surrogatepass'), digest_size=16).digest())
+    document = _parsed_bodies.get(key)
+    if document is None:
+        document = HTML_BACKENDS[backend](mail_body)
+        _parsed_bodies[key] = document
+        if len(_parsed_bodies) > PARSED_BODIES_CACHE_SIZE:
+            _parsed_bodies.popitem(last=False)
+    else:
+        _parsed_bodies.move_to_end(key)
+    return document
+
+def clear_parsed_bodies_cache():
+    _parsed_bodies.clear()
+
 class MailBodyAnalyzer(object):
     def __init__(self,
                  mail_body,
                  lower=True,
                  asyncio_loop=None,
-                 img_size_url_finder=False):
-        self.soup = BeautifulSoup(mail_body, features="html.parser")
-        tags_to_remove = ['script', 'style']
-        for tag in self.soup.find_all(tags_to_remove):
-            tag.extract()
+                 img_size_url_finder=False,
+                 image_sizes=None,
+                 backend=DEFAULT_HTML_BACKEND,
+                 document=None):
+        # document is an already parsed document of mail_body, shared by analyzers of the same body
+        self.document = document if document is not None else parse_mail_body(mail_body, backend=backend)
         self.lower = lower
         if type(mail_body) != str:
             self.mail_body = ''
         else:
             self.mail_body = mail_body
-        self.raw_text_ = None
         self.asyncio_loop = asyncio_loop
         self.img_size_url_finder = img_size_url_finder
+        # url -> (width, height) from image_probe, used instead of fetching images one by one
+        self.image_sizes = image_sizes
+
+    @property
+    def soup(self):
+        return self.document.soup
 
     def __str__(self):
         return self.mail_body
@@ -57,62 +198,70 @@ class MailBodyAnalyzer(object):
         raw_text = self.get_raw_text()
         return len(raw_text)
 
-    def get_raw_text(self):
-        if self.raw_text_ is None:
-            self.raw_text_ = re.sub(' +', ' ', self.soup.get_text(' ').replace(u'\xa0', u' '))
+    def _compute_raw_text(self):
         if self.lower:
-            self.raw_text_ = self.raw_text_.lower()
-        return self.raw_text_
-    
+            return self.document.memoize(('raw_text', False), self._compute_raw_text_not_lowered).lower()
+        return self._compute_raw_text_not_lowered()
+
+    def _compute_raw_text_not_lowered(self):
+        return re.sub(' +', ' ', self.document.get_text().replace(u'\xa0', u' '))
+
+    def get_raw_text(self):
+        return self.document.memoize(('raw_text', self.lower), self._compute_raw_text)
+
+    def _compute_clean_text(self):
+        return CLEAN_TEXT_TOKENIZER.process(self.get_raw_text())
+
     def get_clean_text(self):
-        raw_text = self.get_raw_text()
-        smtk = SocialMediaTokenizer(raw_text, specify_url_type=True)
-        smtk.tokenize()
-        smtk.process_text()    
-        return smtk.clean_text_
+        return self.document.memoize(('clean_text', self.lower), self._compute_clean_text)
 
     def get_clean_tokens(self):
-        raw_text = self.get_raw_text()
-        return re.findall("[a-zA-Z0-9]+|{{.*?}}", raw_text)
+        return self.document.memoize(('clean_tokens', self.lower),
+                                     lambda: re.findall("[a-zA-Z0-9]+|{{.*?}}", self.get_raw_text()))
 
     def extract_cutsom_fields(self):
-        raw_text = self.get_raw_text()
-        return re.findall("{{.*?}}", raw_text)
+        return self.document.memoize(('custom_fields', self.lower),
+                                     lambda: re.findall("{{.*?}}", self.get_raw_text()))
     
     def extract_specific_text_patterns(self):
         raw_text = self.get_raw_text()
         return re.findall("[.*?]", raw_text)
 
     def get_tags_number(self):
-        return len(self.soup.find_all())
+        return self.document.memoize('tags_number', self.document.get_tags_number)
+
+    def get_images_array(self):
+        """
+        One (width, height) record per img tag, NaN for unknown dimensions.
+        """
+        if self.img_size_url_finder or self.image_sizes is not None:
+            return self._compute_images_array()
+        return self.document.memoize('images_array', self._compute_images_array)
+
+    def _compute_images_array(self):
+        images_tags = self.document.get_images()
+        images = np.full(len(images_tags), np.nan, dtype=IMAGE_INFO_DTYPE)
+        for i, img in enumerate(images_tags):
+            src, srcset_width = image_source(img)
+            if src is None:
+                continue
+            width, height = image_dimensions(img)
+            if np.isnan(width):
+                width = srcset_width
+            if np.isnan(width) or np.isnan(height):
+                if self.image_sizes is not None:
+                    size = self.image_sizes.get(src)
+                    if size is not None:
+                        width, height = size
+                elif self.img_size_url_finder:
+                    # Only this per image fetch needs fastimage, image_probe is the batch alternative
+                    from fastimage.fastimage.detect import get_size
+                    if self.asyncio_loop is None:
+                        self.asyncio_loop = asyncio.get_event_loop()
+                    width, height = self.asyncio_loop.run_until_complete(get_size(src))
+                    width, height = parse_dimension(width), parse_dimension(height)
+            images[i] = (width, height)
+        return images
 
     def get_images_infos(self):
-        images_tags = self.soup.findAll('img')
-        if self.asyncio_loop is None:
-            self.asyncio_loop = asyncio.get_event_loop()
-        loop = self.asyncio_loop
-        if len(images_tags) == 0:
-            return []
-        else:
-            result = []
-            for img in images_tags:
-                src = img.get('src')
-                r = {'height': None, 'width': None}
-                if src is not None:
-                    if (img.get('height') is None or img.get('width') is None) and self.img_size_url_finder:
-                        width, height = loop.run_until_complete(get_size(src))
-                    else:
-                        width, height = img.get('width'), img.get('height')
-                    if width is not None and height is not None:
-                        #if width.endswith('px'):
-                        #    width = width[:-2]
-                        #if width.endswith('px;'):
-                        #    width = width[:-3]
-                        #if height.endswith('px'):
-                        #    height = height[:-2]
-                        #if height.endswith('px;'):
-                        #    height = height[:-3]
-                        height, width = re.findall('[0-9]+', height)[0], re.findall('[0-9]+', width)[0]
-                        r = {'width': float(width), 'height': float(height)}
-                result.append(r)
-        return result
\ No newline at end of file
+        return images_infos(self.get_images_array())
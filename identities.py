@@ -0,0 +1,84 @@
+import re
+import logging
+import numpy as np
+import pandas as pd
+
+# '+tag' part of an address, 'siobhan.donovan+1@upfluence.com' -> 'siobhan.donovan@upfluence.com'
+EMAIL_TAG_REGEXP = re.compile(r'\+[^@]*(?=@)')
+
+def normalize_email(email, strip_tags=False):
+    email = email.lower()
+    return EMAIL_TAG_REGEXP.sub('', email) if strip_tags else email
+
+def normalize_emails(serie, strip_tags=False):
+    """
+    Categorical of the normalized emails. Only the categories are normalized, then the ones
+    that collide are merged, so the work does not depend on the number of rows.
+    """
+    serie = serie.astype('category')
+    categories = serie.cat.categories.str.lower()
+    if strip_tags:
+        categories = categories.str.replace(EMAIL_TAG_REGEXP, '', regex=True)
+    categories_codes, normalized_categories = pd.factorize(categories)
+    codes = serie.cat.codes.values
+    codes = np.where(codes >= 0, categories_codes[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, normalized_categories), index=serie.index, name=serie.name)
+
+def categories_lookup(serie, values):
+    """
+    serie.isin(values) as a lookup of each row category code in a boolean table of the categories.
+    """
+    serie = serie.astype('category')
+    categories_table = np.append(serie.cat.categories.isin(list(values)), False)
+    # Missing values have the -1 code, the last entry of the table
+    return categories_table[serie.cat.codes.values]
+
+def dense_codes(serie):
+    """
+    int32 codes of the distinct values of serie (-1 for missing values) and the values,
+    uniques[codes] gives serie back.
+    """
+    codes, uniques = pd.factorize(serie)
+    return codes.astype(np.int32), uniques
+
+# Key of the missing ids, never matched
+MISSING_ID = np.iinfo(np.int64).min
+
+def id_values(ids):
+    return pd.Series(ids).astype('Int64').to_numpy(dtype=np.int64, na_value=MISSING_ID)
+
+class LookupIndex(object):
+    """
+    Hash index of the ids of a table, built once and reused to find the rows of other
+    tables ids (many to one joins). Duplicated ids keep their first row.
+    """
+    def __init__(self, ids, name='ids'):
+        self.name = name
+        values = id_values(ids)
+        index = pd.Index(values)
+        if index.is_unique:
+            self.index, self.rows = index, None
+        else:
+            first_rows = np.flatnonzero(~index.duplicated())
+            self.index, self.rows = index[first_rows], first_rows
+
+    def __len__(self):
+        return len(self.index)
+
+    def positions(self, ids):
+        """
+        Row of each id in the indexed table, -1 for missing ids and ids not found. The ids
+        not found are logged.
+        """
+        values = id_values(ids)
+        positions = self.index.get_indexer(values)
+        if self.rows is not None:
+            positions = np.where(positions >= 0, self.rows[positions], -1)
+        missing = values == MISSING_ID
+        positions[missing] = -1
+        not_found = (positions < 0) & ~missing
+        if not_found.any():
+            missing_ids = np.unique(values[not_found])
+            logging.warning(f"{not_found.sum()} rows with {len(missing_ids)} {self.name} not found, "
+                            f"e.g. {missing_ids[:5].tolist()}")
+        return positions
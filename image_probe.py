@@ -0,0 +1,182 @@
+import time
+import struct
+import sqlite3
+import asyncio
+import logging
+import aiohttp
+import numpy as np
+from html_utils import parse_mail_body, image_source, image_dimensions
+
+PROBE_CONCURRENCY = 32
+PROBE_TIMEOUT = 10
+MAX_HEADER_BYTES = 64 * 1024
+SIZES_TTL = 30 * 24 * 3600
+# Failures are retried sooner than successes expire
+FAILURES_TTL = 24 * 3600
+SQLITE_MAX_VARIABLES = 500
+
+def png_size(data):
+    if len(data) < 24:
+        return None
+    if data[12:16] == b'IHDR':
+        return struct.unpack('>II', data[16:24])
+    return struct.unpack('>II', data[8:16])
+
+def gif_size(data):
+    if len(data) < 10:
+        return None
+    return struct.unpack('<HH', data[6:10])
+
+def bmp_size(data):
+    if len(data) < 26:
+        return None
+    width, height = struct.unpack('<ii', data[18:26])
+    return width, abs(height)
+
+def webp_size(data):
+    if len(data) < 30:
+        return None
+    chunk = data[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3fff, height & 0x3fff
+    if chunk == b'VP8L':
+        bits = int.from_bytes(data[21:25], 'little')
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    return None
+
+def jpeg_size(data):
+    position = 2
+    while position + 9 < len(data):
+        if data[position] != 0xff:
+            return None
+        marker = data[position + 1]
+        if marker == 0xff:
+            position += 1
+            continue
+        # Start of frame markers, except DHT, JPG and DAC
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack('>HH', data[position + 5:position + 9])
+            return width, height
+        position += 2 + struct.unpack('>H', data[position + 2:position + 4])[0]
+    return None
+
+def image_header_size(data):
+    """
+    (width, height) from the first bytes of a PNG, GIF, JPEG, BMP or WebP image,
+    None if more bytes are needed or the format is unknown.
+    """
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return png_size(data)
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return gif_size(data)
+    if data.startswith(b'\xff\xd8'):
+        return jpeg_size(data)
+    if data.startswith(b'BM'):
+        return bmp_size(data)
+    if data.startswith(b'RIFF') and data[8:12] == b'WEBP':
+        return webp_size(data)
+    return None
+
+class ImageSizeCache(object):
+    """
+    Persistent url -> (width, height) cache. Failed probes are stored with a None size
+    (negative caching) and expire after FAILURES_TTL instead of SIZES_TTL.
+    """
+    def __init__(self, path, ttl=SIZES_TTL, failures_ttl=FAILURES_TTL):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS image_sizes '
+                                '(url TEXT PRIMARY KEY, width INTEGER, height INTEGER, fetched_at REAL)')
+        self.ttl = ttl
+        self.failures_ttl = failures_ttl
+
+    def get_many(self, urls, now=None):
+        """
+        Fresh cached sizes of urls, as a dict url -> (width, height) or None.
+        """
+        now = time.time() if now is None else now
+        urls = list(urls)
+        sizes = {}
+        for start in range(0, len(urls), SQLITE_MAX_VARIABLES):
+            batch = urls[start:start + SQLITE_MAX_VARIABLES]
+            rows = self.connection.execute(
+                f'SELECT url, width, height, fetched_at FROM image_sizes WHERE url IN ({",".join("?" * len(batch))})',
+                batch)
+            for url, width, height, fetched_at in rows:
+                if width is None:
+                    if now - fetched_at < self.failures_ttl:
+                        sizes[url] = None
+                elif now - fetched_at < self.ttl:
+                    sizes[url] = (width, height)
+        return sizes
+
+    def set_many(self, sizes, now=None):
+        now = time.time() if now is None else now
+        rows = [(url, *(size if size is not None else (None, None)), now) for url, size in sizes.items()]
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO image_sizes VALUES (?, ?, ?, ?)', rows)
+
+    def close(self):
+        self.connection.close()
+
+async def fetch_image_size(session, semaphore, url):
+    async with semaphore:
+        try:
+            async with session.get(url, headers={'Range': f'bytes=0-{MAX_HEADER_BYTES - 1}'}) as response:
+                if response.status >= 400:
+                    return None
+                data = b''
+                async for chunk in response.content.iter_chunked(4096):
+                    data += chunk
+                    size = image_header_size(data)
+                    if size is not None or len(data) >= MAX_HEADER_BYTES:
+                        return size
+                return image_header_size(data)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, struct.error):
+            return None
+
+async def probe_images(urls, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT):
+    """
+    Sizes of urls fetched concurrently, at most concurrency requests in flight on one
+    pooled session. Only the image header bytes are downloaded.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        sizes = await asyncio.gather(*[fetch_image_size(session, semaphore, url) for url in urls])
+    return dict(zip(urls, sizes))
+
+def missing_size_image_urls(mail_bodies):
+    """
+    Distinct src of the images whose width or height cannot be read from the tag.
+    """
+    urls = set()
+    for mail_body in mail_bodies:
+        for img in parse_mail_body(mail_body).get_images():
+            src, srcset_width = image_source(img)
+            width, height = image_dimensions(img)
+            if src is not None and ((np.isnan(width) and np.isnan(srcset_width)) or np.isnan(height)):
+                urls.add(src)
+    return urls
+
+def probe_image_sizes(mail_bodies, cache_path, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT):
+    """
+    url -> (width, height) (None when unknown) for every image of mail_bodies missing its
+    dimensions. Cached sizes are reused, the others are probed and cached.
+    """
+    urls = missing_size_image_urls(mail_bodies)
+    cache = ImageSizeCache(cache_path)
+    try:
+        sizes = cache.get_many(urls)
+        to_probe = [url for url in urls if url not in sizes and url.startswith(('http://', 'https://'))]
+        logging.info(f"Image sizes : {len(sizes)} cached, {len(to_probe)} to probe")
+        if to_probe:
+            probed_sizes = asyncio.run(probe_images(to_probe, concurrency=concurrency, timeout=timeout))
+            cache.set_many(probed_sizes)
+            sizes.update(probed_sizes)
+    finally:
+        cache.close()
+    return sizes
@@ -0,0 +1,247 @@
+import os
+import json
+import uuid
+import datetime
+import logging
+import pandas as pd
+from process_dataframe import load_mailings_dataframe, load_threads_dataframe, load_emails_inbox_dataframe, \
+    merge_dataframes, clean_merged_emails_dataframe, keep_only_first_mail_and_response, mailings_counts
+from feature_engineering import add_company_columns, template_keys, template_features, join_template_features
+
+WATERMARK_FILE = 'watermark.json'
+MERGED_EMAILS_DIR = 'merged_emails'
+CLEANED_EMAILS_DIR = 'cleaned_emails'
+TEMPLATE_FEATURES_FILE = 'template_features.parquet'
+MAILINGS_COUNTS_FILE = 'mailings_counts.parquet'
+# Emails are partitioned by thread_id % NB_THREAD_BUCKETS, a run reads and writes the buckets
+# of the threads it touches only
+BUCKET_COLUMN = 'thread_bucket'
+NB_THREAD_BUCKETS = 256
+
+def thread_buckets(thread_ids):
+    return (pd.Series(thread_ids).astype('int64') % NB_THREAD_BUCKETS).astype('int64')
+
+def bucket_dir(dataset_dir, bucket):
+    return os.path.join(dataset_dir, f'{BUCKET_COLUMN}={bucket}')
+
+def run_file_id(file_name):
+    return file_name.split('-')[0]
+
+class IncrementalState(object):
+    """
+    Persisted output of the previous runs: every merged email up to the watermark, the
+    cleaned first mail / first response of each thread, the features of every template
+    seen so far and the additive per mailing counts.
+
+    Emails are parquet datasets partitioned by thread bucket. Each run appends its new merged
+    emails as new files and rewrites the cleaned buckets of its touched threads only, file names
+    start with the run id (features and counts files too). The watermark file commits a run :
+    files of uncommitted runs are removed on load, as are the files the last committed run
+    replaced.
+    """
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.watermark = None
+        self.runs = []
+        self.replaced_buckets = []
+        self.features_df = None
+        self.counts_df = None
+
+    def path(self, name):
+        return os.path.join(self.state_dir, name)
+
+    def load(self):
+        if not os.path.exists(self.path(WATERMARK_FILE)):
+            self.remove_uncommitted_files()
+            return self
+        with open(self.path(WATERMARK_FILE)) as f:
+            watermark = json.load(f)
+        self.watermark = datetime.datetime.fromisoformat(watermark['created_at'])
+        self.runs = watermark['runs']
+        self.replaced_buckets = watermark['replaced_buckets']
+        self.remove_uncommitted_files()
+        if os.path.exists(self.run_path(self.runs[-1], TEMPLATE_FEATURES_FILE)):
+            self.features_df = pd.read_parquet(self.run_path(self.runs[-1], TEMPLATE_FEATURES_FILE))
+        self.counts_df = pd.read_parquet(self.run_path(self.runs[-1], MAILINGS_COUNTS_FILE))
+        return self
+
+    def run_path(self, run_id, name):
+        return self.path(f'{run_id}-{name}')
+
+    def remove_uncommitted_files(self):
+        runs = set(self.runs)
+        # Features and counts of the last committed run only
+        if os.path.isdir(self.state_dir):
+            for file_name in os.listdir(self.state_dir):
+                if file_name.endswith((TEMPLATE_FEATURES_FILE, MAILINGS_COUNTS_FILE)) and \
+                        (not self.runs or run_file_id(file_name) != self.runs[-1]):
+                    os.remove(self.path(file_name))
+        for dataset in [MERGED_EMAILS_DIR, CLEANED_EMAILS_DIR]:
+            dataset_dir = self.path(dataset)
+            if not os.path.isdir(dataset_dir):
+                continue
+            for partition in os.listdir(dataset_dir):
+                for file_name in os.listdir(os.path.join(dataset_dir, partition)):
+                    if run_file_id(file_name) not in runs:
+                        os.remove(os.path.join(dataset_dir, partition, file_name))
+        # Cleaned buckets rewritten by the last run keep its files only
+        if self.runs:
+            for bucket in self.replaced_buckets:
+                partition_dir = bucket_dir(self.path(CLEANED_EMAILS_DIR), bucket)
+                if not os.path.isdir(partition_dir):
+                    continue
+                for file_name in os.listdir(partition_dir):
+                    if run_file_id(file_name) != self.runs[-1]:
+                        os.remove(os.path.join(partition_dir, file_name))
+
+    def read_emails(self, dataset, thread_ids=None, buckets=None):
+        """
+        Emails of the dataset, only of thread_ids or of buckets when given, reading their
+        buckets only.
+        """
+        dataset_dir = self.path(dataset)
+        if not os.path.isdir(dataset_dir) or not os.listdir(dataset_dir):
+            return None
+        filters = []
+        if thread_ids is not None:
+            buckets = thread_buckets(thread_ids).unique()
+            filters.append(('thread_id', 'in', [int(thread_id) for thread_id in thread_ids]))
+        if buckets is not None:
+            filters.append((BUCKET_COLUMN, 'in', [int(bucket) for bucket in buckets]))
+        df = pd.read_parquet(dataset_dir, filters=filters or None)
+        df.drop(BUCKET_COLUMN, axis=1, inplace=True)
+        return df
+
+    def write_emails(self, dataset, df, run_id):
+        if len(df) == 0:
+            return
+        df = df.copy()
+        df[BUCKET_COLUMN] = thread_buckets(df['thread_id']).values
+        df.to_parquet(self.path(dataset), partition_cols=[BUCKET_COLUMN], index=False,
+                      basename_template=f'{run_id}-{{i}}.parquet')
+
+    def cleaned_emails(self):
+        return self.read_emails(CLEANED_EMAILS_DIR)
+
+    def save(self, run_id, new_merged_df, touched_cleaned_df, touched_threads):
+        """
+        Append the new merged emails and replace the cleaned emails of the touched threads,
+        reading and writing their buckets only.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.write_emails(MERGED_EMAILS_DIR, new_merged_df, run_id)
+
+        replaced_buckets = sorted(set(thread_buckets(touched_threads)))
+        cleaned_df = self.read_emails(CLEANED_EMAILS_DIR, buckets=replaced_buckets)
+        if cleaned_df is not None:
+            cleaned_df = cleaned_df[~cleaned_df['thread_id'].isin(touched_threads)]
+            touched_cleaned_df = pd.concat([cleaned_df, touched_cleaned_df], ignore_index=True)
+        self.write_emails(CLEANED_EMAILS_DIR, touched_cleaned_df, run_id)
+
+        if self.features_df is not None:
+            self.features_df.to_parquet(self.run_path(run_id, TEMPLATE_FEATURES_FILE), index=False)
+        self.counts_df.to_parquet(self.run_path(run_id, MAILINGS_COUNTS_FILE))
+        # Watermark last, an interrupted save is rolled back on the next load
+        self.runs = self.runs + [run_id]
+        self.replaced_buckets = [int(bucket) for bucket in replaced_buckets]
+        with open(self.path(WATERMARK_FILE + '.tmp'), 'w') as f:
+            json.dump({'created_at': self.watermark.isoformat(), 'runs': self.runs,
+                       'replaced_buckets': self.replaced_buckets}, f)
+        os.replace(self.path(WATERMARK_FILE + '.tmp'), self.path(WATERMARK_FILE))
+        self.remove_uncommitted_files()
+
+    def emails_features(self, user_id_to_company_id, company_id_to_name):
+        df = add_company_columns(self.cleaned_emails(), user_id_to_company_id, company_id_to_name)
+        df['template_key'] = template_keys(df)
+        return join_template_features(df, self.features_df)
+
+    def mailings_stats(self, mailings_df, nb_min_threads):
+        """
+        Mailings statistics of keep_mailings_min_threads, from the persisted counts.
+        """
+        counts_df = self.counts_df
+        # Holders of removed rows stay in the counts with 0 threads or 0 sent mails
+        counts_df = counts_df[(counts_df['nb_threads'] > 0) & (counts_df['nb_threads'] >= nb_min_threads) &
+                              (counts_df['nb_sent_mails'] > 0)]
+        stats_df = pd.DataFrame({
+            'id': counts_df.index,
+            'response_rate': (counts_df['nb_answered_mails'] / counts_df['nb_sent_mails']).values,
+            'nb_answered_mails': counts_df['nb_answered_mails'].values,
+            'holder_id': counts_df.index,
+            'nb_threads': counts_df['nb_threads'].values
+        })
+        return pd.merge(mailings_df, stats_df, on='id')
+
+def update_counts(counts_df, removed_df, added_df):
+    counts_df = counts_df.sub(mailings_counts(removed_df), fill_value=0).add(mailings_counts(added_df), fill_value=0)
+    counts_df = counts_df[counts_df['nb_threads'] + counts_df['nb_sent_mails'] > 0]
+    return counts_df.astype(int)
+
+def run_incremental(mailings_path,
+                    threads_path,
+                    emails_inbox_path,
+                    state_dir,
+                    user_id_to_company_id,
+                    company_id_to_name,
+                    end_datetime=None,
+                    n_jobs=1,
+                    strip_email_tags=False,
+                    **load_kwargs):
+    """
+    Process the emails created after the persisted watermark. Thread level state is
+    recomputed for the threads they belong to only, and features for unseen templates only.
+    """
+    state = IncrementalState(state_dir).load()
+    start_datetime = state.watermark if state.watermark is not None else pd.Timestamp.min
+    end_datetime = end_datetime if end_datetime is not None else datetime.datetime.now()
+
+    # New emails can belong to old threads and mailings, those tables are not windowed but only
+    # the threads of the new emails and their mailings are kept
+    emails_inbox_df = load_emails_inbox_dataframe(emails_inbox_path, start_datetime, end_datetime, None,
+                                                  **load_kwargs)
+    if state.watermark is not None:
+        emails_inbox_df = emails_inbox_df[emails_inbox_df['created_at'] > state.watermark]
+    threads_df = load_threads_dataframe(threads_path, pd.Timestamp.min, pd.Timestamp.max, None,
+                                        strip_email_tags=strip_email_tags,
+                                        ids=emails_inbox_df['thread_id'].dropna().unique(), **load_kwargs)
+    mailings_df = load_mailings_dataframe(mailings_path, pd.Timestamp.min, pd.Timestamp.max,
+                                          ids=threads_df['holder_id'].dropna().unique(), **load_kwargs)
+    threads_df = threads_df[threads_df['holder_id'].isin(mailings_df['id'])]
+    emails_inbox_df = emails_inbox_df[emails_inbox_df['thread_id'].isin(threads_df['id'])]
+    emails_inbox_df.reset_index(inplace=True, drop=True)
+    logging.info(f"Number of new emails : {len(emails_inbox_df)}")
+    if len(emails_inbox_df) == 0:
+        return state
+
+    new_merged_df = merge_dataframes(emails_inbox_df, threads_df, mailings_df)
+    touched_threads = new_merged_df['thread_id'].unique()
+    logging.info(f"Number of touched threads : {len(touched_threads)}")
+
+    touched_merged_df = new_merged_df
+    old_cleaned_df = new_merged_df.iloc[:0]
+    if state.watermark is not None:
+        old_merged_df = state.read_emails(MERGED_EMAILS_DIR, thread_ids=touched_threads)
+        if old_merged_df is not None:
+            touched_merged_df = pd.concat([old_merged_df, new_merged_df], ignore_index=True)
+        old_cleaned_df = state.read_emails(CLEANED_EMAILS_DIR, thread_ids=touched_threads)
+    touched_cleaned_df = keep_only_first_mail_and_response(clean_merged_emails_dataframe(touched_merged_df))
+
+    if state.watermark is None:
+        state.counts_df = mailings_counts(touched_cleaned_df)
+    else:
+        state.counts_df = update_counts(state.counts_df, old_cleaned_df, touched_cleaned_df)
+
+    templates_df = add_company_columns(touched_cleaned_df.copy(), user_id_to_company_id, company_id_to_name)
+    templates_df['template_key'] = template_keys(templates_df)
+    if state.features_df is not None:
+        templates_df = templates_df[~templates_df['template_key'].isin(state.features_df['template_key'])]
+    if len(templates_df) > 0:
+        new_features_df = template_features(templates_df, n_jobs=n_jobs)
+        state.features_df = new_features_df if state.features_df is None else \
+            pd.concat([state.features_df, new_features_df], ignore_index=True)
+    logging.info(f"Number of new templates : {templates_df['template_key'].nunique()}")
+
+    state.watermark = emails_inbox_df['created_at'].max().to_pydatetime()
+    state.save(uuid.uuid4().hex, new_merged_df, touched_cleaned_df, touched_threads)
+
+    return state
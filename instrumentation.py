@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import cProfile
+import resource
+import functools
+import pandas as pd
+
+_recorder = None
+
+class Recorder(object):
+    """
+    Stage records of the current process. Stages nested in a profiled stage are timed but
+    not profiled separately, a single cProfile profiler can run at a time.
+    """
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+        self.records = []
+        self.profiling = False
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+
+def enable_instrumentation(profile_dir=None):
+    """
+    Record the stages run from now on. With profile_dir, a cProfile dump of each stage is
+    written there as <stage>-<pid>-<index>.prof.
+    """
+    global _recorder
+    _recorder = Recorder(profile_dir)
+
+def disable_instrumentation():
+    global _recorder
+    _recorder = None
+
+def instrumentation_enabled():
+    return _recorder is not None
+
+def stage_records():
+    return list(_recorder.records) if _recorder is not None else []
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        # Peak instead of current RSS where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+def nb_rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple):
+        for item in value:
+            if isinstance(item, (pd.DataFrame, pd.Series)):
+                return len(item)
+    return None
+
+class Stage(object):
+    """
+    Context manager recording wall time, CPU time, rows in/out and RSS delta of a block,
+    nothing is done when instrumentation is disabled.
+
+        with Stage('readability', df) as s:
+            ...
+            s.rows_out = len(df)
+    """
+    __slots__ = ['name', 'rows_in', 'rows_out', 'recorder', 'profiler', 'start_wall', 'start_cpu', 'start_rss']
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.recorder = None
+
+    def __enter__(self):
+        recorder = _recorder
+        if recorder is None:
+            return self
+        self.recorder = recorder
+        if isinstance(self.rows_in, (pd.DataFrame, pd.Series, tuple)):
+            self.rows_in = nb_rows(self.rows_in)
+        self.profiler = None
+        if recorder.profile_dir is not None and not recorder.profiling:
+            recorder.profiling = True
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start_rss = current_rss_mb()
+        self.start_cpu = time.process_time()
+        self.start_wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        recorder = self.recorder
+        if recorder is None:
+            return False
+        wall_time = time.perf_counter() - self.start_wall
+        cpu_time = time.process_time() - self.start_cpu
+        record = {
+            'stage': self.name,
+            'pid': os.getpid(),
+            'wall_time': wall_time,
+            'cpu_time': cpu_time,
+            'rows_in': self.rows_in,
+            # Blocks adding columns keep their rows
+            'rows_out': self.rows_out if self.rows_out is not None else self.rows_in,
+            'rss_delta_mb': current_rss_mb() - self.start_rss,
+            'failed': exc_type is not None
+        }
+        if self.profiler is not None:
+            self.profiler.disable()
+            recorder.profiling = False
+            profile_path = os.path.join(recorder.profile_dir,
+                                        f'{self.name}-{os.getpid()}-{len(recorder.records)}.prof')
+            self.profiler.dump_stats(profile_path)
+            record['profile'] = profile_path
+        recorder.records.append(record)
+        return False
+
+def instrumented(name=None):
+    """
+    Decorator recording each call of a function as a stage, rows in are the rows of its
+    first DataFrame argument and rows out the rows of its (first) DataFrame result.
+    """
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return function(*args, **kwargs)
+            rows_in = next((nb_rows(arg) for arg in args if isinstance(arg, (pd.DataFrame, pd.Series))), None)
+            with Stage(stage_name, rows_in) as s:
+                result = function(*args, **kwargs)
+                s.rows_out = nb_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+def collect_stage_records(profile_dir, function, *args, **kwargs):
+    """
+    Run function in a worker process with its own recorder, returns (result, records).
+    """
+    global _recorder
+    previous_recorder = _recorder
+    _recorder = Recorder(profile_dir)
+    try:
+        result = function(*args, **kwargs)
+        return result, _recorder.records
+    finally:
+        _recorder = previous_recorder
+
+def worker_function(function):
+    """
+    function to give to a process pool, recording its stages in the worker when enabled.
+    Its results must go through worker_results.
+    """
+    if _recorder is None:
+        return function
+    return functools.partial(collect_stage_records, _recorder.profile_dir, function)
+
+def worker_results(results):
+    if _recorder is None:
+        return list(results)
+    outputs = []
+    for result, records in results:
+        outputs.append(result)
+        _recorder.records.extend(records)
+    return outputs
+
+def instrumentation_report():
+    """
+    Stage records and per stage totals, JSON serializable.
+    """
+    records = stage_records()
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record['stage'], {'calls': 0, 'wall_time': 0., 'cpu_time': 0.,
+                                                    'rows_in': 0, 'rows_out': 0, 'rss_delta_mb': 0.})
+        total['calls'] += 1
+        for key in ['wall_time', 'cpu_time', 'rss_delta_mb']:
+            total[key] += record[key]
+        for key in ['rows_in', 'rows_out']:
+            total[key] += record[key] or 0
+    return {'stages': records, 'totals': totals}
+
+def write_instrumentation_report(path):
+    with open(path, 'w') as f:
+        json.dump(instrumentation_report(), f, indent=2)
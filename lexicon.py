@@ -0,0 +1,142 @@
+import re
+import string
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+first_person_pronouns = ['i', 'me', 'my', 'mine', 'myself']
+second_person_pronouns = ['you', 'your', 'yours', 'yourself', 'yourselves']
+first_person_plural_pronouns = ['we', 'us', 'our', 'ours', 'ourselves']
+third_person_plural_pronouns = ['they', 'them', 'their', 'theirs', 'themselves']
+third_person_pronouns = ['he', 'she', 'him', 'her', 'his', 'hers', 'himself', 'herself']
+currency_symbols = ['$', '£', '€']
+call_to_action_words = ['click', 'apply', 'join', 'reply', 'register', 'subscribe', 'signup', 'contact', 'visit',
+                        'discover', 'download', 'book', 'schedule']
+
+# Word boundaries of TextBlob words : texts are split on whitespace and on the separators of the
+# nltk word tokenizer, then punctuation is stripped from both ends of each token. Words joined by
+# '-', '/' or '.' (self-made, you/me, i.e.) are single tokens, -we, you/ or (he's are not.
+SEPARATOR_CHARS = r';@#$%&?!*()\[\]{}<>"`' + '\u2012-\u2015\u00ab\u00bb\u201c\u201d\u2018\u2019\u201e'
+SEPARATOR = r'(?:[' + SEPARATOR_CHARS + r']|[,:](?!\d)|\.\.|--)'
+# Token start, where leading punctuation is stripped
+WORD_START = r'(?:^|(?<=\s)|(?<=[' + SEPARATOR_CHARS + r',:])|(?<=\.\.)|(?<=--))'
+# A quote before a word is split from it when it does not follow a word character
+QUOTE_START = r"(?<=')(?<!\w')"
+TOKEN_END = r'(?:$|\s|' + SEPARATOR + ')'
+# Contractions split from their word (he's -> he 's, isn't -> is n't), at most one of each nltk pass
+CONTRACTION = r"(?:(?:'ll|'re|'ve|(?<!')n't)(?:'[smd]?)?|'[smd]?)(?:'(?=\s))?\.?"
+# Stripped punctuation then a token end, a contraction or a quote split from the next word
+WORD_END = (r'(?=[' + re.escape(string.punctuation) + r']*(?:' + TOKEN_END + '|' + CONTRACTION + TOKEN_END +
+            r"|(?<!\w)'(?!(?:re|ve|ll|m|t|s|d|n)\b)\w))")
+
+# Lexicon classes, terms are lowercase words or non word symbols
+LEXICON = {
+    'i': first_person_pronouns,
+    'we': first_person_plural_pronouns,
+    'he': third_person_pronouns,
+    'they': third_person_plural_pronouns,
+    'you': second_person_pronouns,
+    'currency': currency_symbols,
+    'call_to_action': call_to_action_words
+}
+
+# Count features, column -> summed lexicon classes. nb_we_and_i counts third person pronouns
+# too, as it always has
+LEXICON_FEATURES = {
+    'nb_i': ['i'],
+    'nb_we': ['we'],
+    'nb_we_and_i': ['we', 'i', 'he'],
+    'nb_he': ['he'],
+    'nb_they': ['they'],
+    'nb_he_and_they': ['he', 'they'],
+    'nb_you': ['you'],
+    'nb_currency': ['currency'],
+    'nb_call_to_action': ['call_to_action']
+}
+
+# Ratio features, column -> (numerator, denominator) count features. The numerator is kept
+# when the denominator is 0.
+LEXICON_RATIOS = {
+    'ratio_you_we': ('nb_you', 'nb_we'),
+    'ratio_you_i': ('nb_you', 'nb_i'),
+    'ratio_you_first': ('nb_you', 'nb_we_and_i')
+}
+
+class LexiconVectorizer(object):
+    """
+    Sparse document-term counts of the lexicon terms, texts are scanned once by a single
+    regexp of all the terms. Words match whole tokens, symbols anywhere.
+    """
+    def __init__(self, lexicon=LEXICON):
+        self.lexicon = {name: list(terms) for name, terms in lexicon.items()}
+        self.vocabulary = {}
+        for terms in self.lexicon.values():
+            for term in terms:
+                self.vocabulary.setdefault(term, len(self.vocabulary))
+
+        words = [term for term in self.vocabulary if re.fullmatch(r'\w+', term)]
+        symbols = [term for term in self.vocabulary if term not in words]
+        # Longest first, alternatives are tried in order. Symbols come first and the punctuation
+        # stripped before a word excludes them, so that a symbol before a word is counted too
+        patterns = []
+        if symbols:
+            symbols_alternatives = '|'.join(map(re.escape, sorted(symbols, key=len, reverse=True)))
+            patterns.append('(' + symbols_alternatives + ')')
+        if words:
+            words_alternatives = '|'.join(map(re.escape, sorted(words, key=len, reverse=True)))
+            stripped = re.escape(''.join(char for char in string.punctuation if char not in symbols))
+            word_start = '(?:' + WORD_START + "(?:(?!')[" + stripped + ']+)?|' + QUOTE_START + '(?:_[' + stripped + ']*)?)'
+            patterns.append(word_start + '(' + words_alternatives + ')' + WORD_END)
+        self.terms_regexp = re.compile('|'.join(patterns)) if patterns else None
+
+        # Terms x classes indicator matrix
+        rows = [self.vocabulary[term] for terms in self.lexicon.values() for term in terms]
+        columns = [i for i, terms in enumerate(self.lexicon.values()) for _ in terms]
+        self.classes_matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)),
+                                                shape=(len(self.vocabulary), len(self.lexicon)))
+
+    def transform(self, texts):
+        """
+        Documents x terms CSR matrix of counts, texts must be lowercase.
+        """
+        vocabulary = self.vocabulary
+        indices = []
+        indptr = [0]
+        for text in texts:
+            if self.terms_regexp is not None:
+                indices.extend(vocabulary[match.group(match.lastindex)]
+                               for match in self.terms_regexp.finditer(text))
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), np.array(indices, dtype=np.int32),
+                                    np.array(indptr, dtype=np.int64)),
+                                   shape=(len(indptr) - 1, len(vocabulary)))
+        matrix.sum_duplicates()
+        return matrix
+
+    def class_counts_array(self, document_terms):
+        return (document_terms @ self.classes_matrix).toarray()
+
+    def class_counts(self, document_terms):
+        """
+        Documents x lexicon classes DataFrame of counts.
+        """
+        return pd.DataFrame(self.class_counts_array(document_terms), columns=list(self.lexicon))
+
+def lexicon_feature_columns(class_counts, classes, features=LEXICON_FEATURES, ratios=LEXICON_RATIOS):
+    """
+    Count and ratio features as a dict of arrays, from a documents x classes array of counts.
+    """
+    positions = {name: i for i, name in enumerate(classes)}
+    columns = {name: class_counts[:, [positions[c] for c in feature_classes]].sum(axis=1)
+               for name, feature_classes in features.items()}
+    for name, (numerator, denominator) in ratios.items():
+        numerator, denominator = columns[numerator], columns[denominator]
+        columns[name] = np.divide(numerator, denominator, out=numerator.astype(float), where=denominator != 0)
+    return columns
+
+def lexicon_features(class_counts, features=LEXICON_FEATURES, ratios=LEXICON_RATIOS):
+    """
+    Count and ratio features from the lexicon classes counts DataFrame.
+    """
+    return pd.DataFrame(lexicon_feature_columns(class_counts.values, class_counts.columns, features, ratios),
+                        index=class_counts.index)
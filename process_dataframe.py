@@ -1,8 +1,13 @@
 import re
-import datetime
+import time
+import importlib.util
 import logging
-from collections import Counter
+import numpy as np
 import pandas as pd
+from instrumentation import instrumented
+from identities import normalize_email, normalize_emails, categories_lookup, dense_codes, LookupIndex
+
+DEFAULT_CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
 
 USEFUL_COLUMNS_THREADS = ['id', 'influencer_id', 'influencer_email', 'user_email', 'is_mailing', 'holder_id', 'replied']
 USEFUL_COLUMNS_MAILINGS = ['id', 'name', 'active', 'owned_by', 'created_by', 'provider_type']
@@ -22,45 +27,177 @@ INBOX_DEMO_MAILS = set([
     'thomas.isaac@upfluence.com', 'jacob.wesdorp@upfluence.com', 'vivien.yang@upfluence.com', 'alice.cichon@upfluence.com', \
     'jessica.gales@upfluence.com', 'adam.shapiro@upfluence.com'
 ])
+# Normalized like the loaded emails, with or without strip_email_tags
+INBOX_DEMO_NORMALIZED_MAILS = set(normalize_email(email, strip_tags) for email in INBOX_DEMO_MAILS
+                                  for strip_tags in [False, True])
 MIN_RESPONSE_TIME = 30
 MIN_RESPONSE_TIME_NON_RE = 600
-RESPONSE_PATTERNS = ['re:', '回复:', '回覆:', 'sv:', 'antw:', 'vs:', 'ref:', 'aw:', 'ΑΠ:', 'bls:', 'res:', 'odp:', 'ynt:']
-RESPONSE_PATTERNS += ['fw:', '轉寄:', '轉寄:', 'vs:', 'doorst:', 'vl:', 'tr:', 'wg:', 'ΠΡΘ:', 'trs:', 'vb:', 'rv:', 'enc:', 'pd:', 'İLT']
+
+# Threads with 0, 1, 2 and 3 or more influencer replies
+REPLIES_HISTOGRAM_SIZE = 4
+REPLIES_HISTOGRAM_COLUMNS = ['nb_threads_0_replies', 'nb_threads_1_replies', 'nb_threads_2_replies',
+                             'nb_threads_3_or_more_replies']
+REPLY_PATTERNS_LANGUAGES = {
+    're:': 'en', '回复:': 'zh', '回覆:': 'zh', 'sv:': 'sv', 'antw:': 'nl', 'vs:': 'fi', 'ref:': 'other', 'aw:': 'de',
+    'ΑΠ:': 'el', 'bls:': 'id', 'res:': 'pt', 'odp:': 'pl', 'ynt:': 'tr'
+}
+FORWARD_PATTERNS_LANGUAGES = {
+    'fw:': 'en', '轉寄:': 'zh', 'doorst:': 'nl', 'vl:': 'fi', 'tr:': 'fr', 'wg:': 'de', 'ΠΡΘ:': 'el', 'trs:': 'other',
+    'vb:': 'sv', 'rv:': 'es', 'enc:': 'pt', 'pd:': 'pl', 'İLT': 'tr'
+}
+RESPONSE_PATTERNS = list(REPLY_PATTERNS_LANGUAGES) + list(FORWARD_PATTERNS_LANGUAGES)
 RESPONSE_PATTERNS += [r[:-1] + ' :' for r in RESPONSE_PATTERNS]
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+DATETIME_COLUMNS = ['created_at', 'updated_at']
+LOADED_COLUMNS_MAILINGS = USEFUL_COLUMNS_MAILINGS + DATETIME_COLUMNS
+LOADED_COLUMNS_THREADS = [col for col in USEFUL_COLUMNS_THREADS if col != 'is_mailing'] + ['holder_type'] + DATETIME_COLUMNS
+LOADED_COLUMNS_EMAILS = ['id', 'thread_id', 'object', 'templated_body', 'templated_object', 'response',
+                         'created_by'] + DATETIME_COLUMNS
+COLUMNS_DTYPES = {
+    'id': 'Int64',
+    'thread_id': 'Int64',
+    'holder_id': 'Int64',
+    'influencer_id': 'Int64',
+    'owned_by': 'Int64',
+    'created_by': 'Int64',
+    'influencer_email': 'category',
+    'user_email': 'category',
+    'holder_type': 'category',
+    'provider_type': 'category'
+}
 MERGE_FIELDS = ['{{influencer_name}}', '{{first_name}}', '{{instagram_name}}', '{{largest_social_media_type}}',
                 '{{instagram_followers}}', '{{application_link}}', '{{largest_social_media_name}}', '{{price}}']
 
+def compile_subject_patterns(patterns_filter=None):
+    groups = {}
+    for subject_type, patterns_languages in [('reply', REPLY_PATTERNS_LANGUAGES),
+                                             ('forward', FORWARD_PATTERNS_LANGUAGES)]:
+        for pattern, language in patterns_languages.items():
+            groups.setdefault(f'{subject_type}_{language}', []).extend([pattern, pattern[:-1] + ' :'])
+    if patterns_filter is not None:
+        groups = {name: [p for p in patterns if patterns_filter(p)] for name, patterns in groups.items()}
+        groups = {name: patterns for name, patterns in groups.items() if patterns}
+    regexp = re.compile('|'.join(f"(?P<{name}>{'|'.join(re.escape(p) for p in patterns)})"
+                                 for name, patterns in groups.items()), flags=re.IGNORECASE)
+    return regexp, list(groups)
+
+SUBJECT_PATTERNS_REGEXP, SUBJECT_LABELS = compile_subject_patterns()
+# Every prefix but 'İLT' has a ':', subjects without one are searched for the others only
+SUBJECT_PATTERNS_WITHOUT_COLON_REGEXP, _ = compile_subject_patterns(lambda pattern: ':' not in pattern)
+SUBJECT_TYPES = ['reply', 'forward', 'none']
+SUBJECT_LANGUAGES = sorted(set(REPLY_PATTERNS_LANGUAGES.values()) | set(FORWARD_PATTERNS_LANGUAGES.values())) + ['none']
+
+def classify_subjects(mail_objects):
+    """
+    Reply / forward prefix found anywhere in each subject, with its language. Every
+    distinct subject is searched once with a single compiled pattern.
+    """
+    codes, uniques = pd.factorize(mail_objects)
+    labels_codes = {}
+    for label in SUBJECT_LABELS:
+        subject_type, subject_language = label.split('_', 1)
+        labels_codes[label] = (SUBJECT_TYPES.index(subject_type), SUBJECT_LANGUAGES.index(subject_language))
+    none_codes = (SUBJECT_TYPES.index('none'), SUBJECT_LANGUAGES.index('none'))
+    matches = [(SUBJECT_PATTERNS_REGEXP if ':' in subject else SUBJECT_PATTERNS_WITHOUT_COLON_REGEXP).search(subject)
+               if type(subject) == str else None for subject in uniques]
+    # Missing subjects have code -1, pointing to the trailing 'none' label
+    uniques_codes = np.array([labels_codes[match.lastgroup] if match is not None else none_codes
+                              for match in matches] + [none_codes], dtype=np.int64).reshape(-1, 2)
+    return pd.DataFrame({
+        'subject_type': pd.Categorical.from_codes(uniques_codes[codes, 0], SUBJECT_TYPES),
+        'subject_language': pd.Categorical.from_codes(uniques_codes[codes, 1], SUBJECT_LANGUAGES)
+    }, index=mail_objects.index)
+
+def parse_datetime_columns(df):
+    for col in DATETIME_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], format=DATETIME_FORMAT)
+    return df
+
+def created_between(df, start_datetime, end_datetime):
+    return (df['created_at'] >= start_datetime) & (df['created_at'] <= end_datetime)
+
+def ids_filter(df, column, ids):
+    """
+    Rows of df whose column is in ids, every row when ids is None.
+    """
+    if ids is None:
+        return pd.Series(True, index=df.index)
+    return df[column].isin(ids)
+
+def read_tsv(path, columns, engine=None, chunk_size=None, rows_filter=None):
+    """
+    With chunk_size, the file is streamed and rows_filter is applied to every chunk
+    before concatenation, so peak memory follows the chunk size instead of the file size.
+    """
+    engine = DEFAULT_CSV_ENGINE if engine is None else engine
+    start = time.perf_counter()
+    header = pd.read_csv(path, sep='\t', nrows=0).columns
+    usecols = [col for col in header if col in columns]
+    dtypes = {col: COLUMNS_DTYPES[col] for col in usecols if col in COLUMNS_DTYPES}
+
+    if chunk_size is None:
+        df = parse_datetime_columns(pd.read_csv(path, sep='\t', usecols=usecols, dtype=dtypes, engine=engine))
+        if rows_filter is not None:
+            df = df[rows_filter(df)]
+    else:
+        # pyarrow engine can not stream, chunks are read with the C engine
+        chunks = []
+        for chunk in pd.read_csv(path, sep='\t', usecols=usecols, dtype=dtypes, engine='c', chunksize=chunk_size):
+            chunk = parse_datetime_columns(chunk)
+            chunks.append(chunk[rows_filter(chunk)] if rows_filter is not None else chunk)
+        df = pd.concat(chunks, ignore_index=True) if len(chunks) > 0 else \
+            parse_datetime_columns(pd.read_csv(path, sep='\t', usecols=usecols, dtype=dtypes, nrows=0))
+        # Chunks categories differ, concat falls back to object
+        for col, dtype in dtypes.items():
+            if dtype == 'category':
+                df[col] = df[col].astype('category')
+
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        logging.info(f"Loaded {path} in {time.perf_counter() - start:.2f}s, "
+                     f"{df.memory_usage(deep=True).sum() / 2**20:.1f} MB")
+
+    return df
+
+@instrumented()
 def load_mailings_dataframe(mailings_path,
                             start_datetime,
-                            end_datetime):
-    mailings_df = pd.read_csv(mailings_path, sep='\t')
-    mailings_df['created_at'] = mailings_df['created_at'].apply(
-        lambda x: datetime.datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f'))
-    mailings_df['updated_at'] = mailings_df['updated_at'].apply(
-        lambda x: datetime.datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f'))
-    mailings_df = mailings_df[
-        (mailings_df['created_at'] >= start_datetime) & (mailings_df['created_at'] <= end_datetime)]
+                            end_datetime,
+                            engine=None,
+                            chunk_size=None,
+                            ids=None):
+    """
+    ids restricts the mailings kept to the given ids.
+    """
+    mailings_df = read_tsv(mailings_path, LOADED_COLUMNS_MAILINGS, engine=engine, chunk_size=chunk_size,
+                           rows_filter=lambda df: ids_filter(df, 'id', ids) &
+                                                  created_between(df, start_datetime, end_datetime))
     mailings_df.reset_index(inplace=True, drop=True)
 
     logging.info(f"Number of mailings campaigns : {mailings_df.shape[0]}")
 
     return mailings_df
 
+@instrumented()
 def load_threads_dataframe(threads_path,
                            start_datetime,
                            end_datetime,
-                           mailings_ids):
-    threads_df = pd.read_csv(threads_path, sep='\t')
-    if 'Unnamed: 0' in threads_df.columns:
-        threads_df.drop(['Unnamed: 0'], axis=1, inplace=True)
-    threads_df = threads_df[threads_df['holder_id'].isin(mailings_ids)]
-    threads_df['created_at'] = threads_df['created_at'].apply(
-        lambda x: datetime.datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f'))
-    threads_df['updated_at'] = threads_df['updated_at'].apply(
-        lambda x: datetime.datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f'))
-    threads_df = threads_df[(threads_df['created_at'] >= start_datetime) & (threads_df['created_at'] <= end_datetime)]
-    threads_df['influencer_email'] = threads_df['influencer_email'].apply(lambda x: x.lower())
-    threads_df['user_email'] = threads_df['user_email'].apply(lambda x: x.lower())
+                           mailings_ids,
+                           engine=None,
+                           chunk_size=None,
+                           strip_email_tags=False,
+                           ids=None):
+    """
+    With strip_email_tags, '+tag' parts of the emails are removed, name+1@ becomes name@.
+    mailings_ids None keeps the threads of every holder, ids restricts the threads kept to the
+    given ids.
+    """
+    threads_df = read_tsv(threads_path, LOADED_COLUMNS_THREADS, engine=engine, chunk_size=chunk_size,
+                          rows_filter=lambda df: ids_filter(df, 'holder_id', mailings_ids) &
+                                                 ids_filter(df, 'id', ids) &
+                                                 created_between(df, start_datetime, end_datetime))
+    threads_df['influencer_email'] = normalize_emails(threads_df['influencer_email'], strip_email_tags)
+    threads_df['user_email'] = normalize_emails(threads_df['user_email'], strip_email_tags)
     threads_df['is_mailing'] = threads_df['holder_type'] == 'Inbox::Model::Mailing'
     threads_df.reset_index(inplace=True, drop=True)
 
@@ -68,18 +205,19 @@ def load_threads_dataframe(threads_path,
 
     return threads_df
 
+@instrumented()
 def load_emails_inbox_dataframe(emails_inbox_path,
                                 start_datetime,
                                 end_datetime,
-                                threads_ids):
-    emails_inbox_df = pd.read_csv(emails_inbox_path, sep='\t')
-    emails_inbox_df = emails_inbox_df[emails_inbox_df['thread_id'].isin(threads_ids)]
-    emails_inbox_df['created_at'] = emails_inbox_df['created_at'].apply(
-        lambda x: datetime.datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f'))
-    emails_inbox_df['updated_at'] = emails_inbox_df['updated_at'].apply(
-        lambda x: datetime.datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f'))
-    emails_inbox_df = emails_inbox_df[
-        (emails_inbox_df['created_at'] >= start_datetime) & (emails_inbox_df['created_at'] <= end_datetime)]
+                                threads_ids,
+                                engine=None,
+                                chunk_size=None):
+    """
+    threads_ids None keeps the emails of every thread.
+    """
+    emails_inbox_df = read_tsv(emails_inbox_path, LOADED_COLUMNS_EMAILS, engine=engine, chunk_size=chunk_size,
+                               rows_filter=lambda df: ids_filter(df, 'thread_id', threads_ids) &
+                                                      created_between(df, start_datetime, end_datetime))
     emails_inbox_df.rename(columns={'object': 'mail_object'}, inplace=True)
     emails_inbox_df['mail_object'] = emails_inbox_df['mail_object'].fillna('')
     emails_inbox_df.reset_index(inplace=True, drop=True)
@@ -88,78 +226,99 @@ def load_emails_inbox_dataframe(emails_inbox_path,
 
     return emails_inbox_df
 
+class ThreadsMailingsLookup(object):
+    """
+    Indexes on threads_df.id and mailings_df.id, built once and reusable for every emails
+    window over the same tables. The mailing row of each thread is resolved at build time,
+    joining emails is then one lookup of their thread_id and a take of the useful columns.
+    """
+    def __init__(self, threads_df, mailings_df):
+        self.threads_index = LookupIndex(threads_df['id'], 'threads')
+        self.mailings_index = LookupIndex(mailings_df['id'], 'mailings')
+        self.threads_columns = {col: threads_df[col].array for col in USEFUL_COLUMNS_THREADS if col != 'id'}
+        self.mailings_columns = {col: mailings_df[col].array for col in USEFUL_COLUMNS_MAILINGS if col != 'id'}
+        self.thread_mailing_positions = self.mailings_index.positions(threads_df['holder_id'])
+
+    def join(self, emails_inbox_df):
+        """
+        emails_inbox_df left joined with the threads then the mailings, as pd.merge would
+        (columns already in the emails get a '_y' suffix).
+        """
+        thread_positions = self.threads_index.positions(emails_inbox_df['thread_id'])
+        mailing_positions = np.where(thread_positions >= 0, self.thread_mailing_positions[thread_positions], -1)
+
+        columns = {col: emails_inbox_df[col].array for col in emails_inbox_df.columns}
+        for positions, table_columns in [(thread_positions, self.threads_columns),
+                                         (mailing_positions, self.mailings_columns)]:
+            for col, values in table_columns.items():
+                name = col + '_y' if col in columns else col
+                columns[name] = pd.api.extensions.take(values, positions, allow_fill=True)
+
+        return pd.DataFrame(columns)
+
+@instrumented()
 def merge_dataframes(emails_inbox_df,
                      threads_df,
-                     mailings_df):
-    df = pd.merge(emails_inbox_df, threads_df[USEFUL_COLUMNS_THREADS], how='left', left_on='thread_id', right_on='id',
-                  suffixes=('', '_y'))
-    del df['id_y']
-    df = pd.merge(df, mailings_df[USEFUL_COLUMNS_MAILINGS], how='left', left_on='holder_id', right_on='id',
-                  suffixes=('', '_y'))
-    del df['id_y']
+                     mailings_df,
+                     lookup=None):
+    """
+    lookup is a ThreadsMailingsLookup of threads_df and mailings_df to reuse.
+    """
+    if lookup is None:
+        lookup = ThreadsMailingsLookup(threads_df, mailings_df)
+
+    return lookup.join(emails_inbox_df)
+
+def compute_thread_sequences(df):
+    """
+    Per message thread state, df must be sorted by thread_id then created_at.
+    """
+    first_in_thread = (df['thread_id'] != df['thread_id'].shift()).fillna(True).astype(bool)
+    thread_segments = first_in_thread.cumsum()
+    previous_created_at = df['created_at'].shift().where(~first_in_thread, df['created_at'])
+
+    df['is_reply'] = ~first_in_thread & (df['is_influencer_reply'] != df['is_influencer_reply'].shift())
+    df['time_difference'] = df['created_at'] - previous_created_at
+    df['timestamp_difference'] = df['time_difference'].dt.total_seconds()
+    df['message_index_in_thread'] = df.groupby(thread_segments).cumcount()
+    df['nb_alternations'] = df['is_reply'].groupby(thread_segments).transform('sum')
+    df['cumulative_response_latency'] = \
+        df['timestamp_difference'].where(df['is_reply'], 0).groupby(thread_segments).cumsum()
 
     return df
 
+@instrumented()
 def clean_merged_emails_dataframe(df):
     df = df.sort_values(by=['holder_id', 'thread_id', 'created_at'])
     df.reset_index(inplace=True, drop=True)
 
-    unique_mails_threads_ids = set([i for (i, ct) in Counter(df['thread_id']).items() if ct == 1])
-    df['single_mail'] = df['thread_id'].isin(unique_mails_threads_ids)
+    thread_codes, _ = dense_codes(df['thread_id'])
+    nb_thread_mails = np.bincount(thread_codes[thread_codes >= 0])
+    df['single_mail'] = np.where(thread_codes >= 0, nb_thread_mails[thread_codes], 0) == 1
     df['answered_mail'] = (1 - df['single_mail']).astype(bool)
     df['is_influencer_reply'] = df['response'] == True
 
     # Abnormal time response
-    previous_thread = -1
-    previous_time = -1
-    time_diff = []
-
-    for thread_id, created_at in df[['thread_id', 'created_at']].values:
-        if thread_id != previous_thread:
-            time_diff.append(created_at)
-            previous_thread = thread_id
-        else:
-            time_diff.append(previous_time)
-        previous_time = created_at
-
-    previous_thread = -1
-    previous_reply_type = -1
-    is_reply = []
-
-    for thread_id, is_inf_reply in df[['thread_id', 'is_influencer_reply']].values:
-        if thread_id != previous_thread:
-            is_reply.append(False)
-            previous_thread = thread_id
-        else:
-            if previous_reply_type != is_inf_reply:
-                is_reply.append(True)
-            else:
-                is_reply.append(False)
-        previous_reply_type = is_inf_reply
-
-    df['is_reply'] = is_reply
-    df['time_difference'] = df['created_at'] - pd.Series(time_diff)
-    df['timestamp_difference'] = df['created_at'].apply(lambda x: x.timestamp()) - \
-                                 pd.Series(time_diff).apply(lambda x: x.timestamp())
-
-
-
-    df = df[~df['user_email'].isin(INBOX_DEMO_MAILS)]
+    df = compute_thread_sequences(df)
+
+    df = df[~categories_lookup(df['user_email'], INBOX_DEMO_NORMALIZED_MAILS)]
     df.reset_index(inplace=True, drop=True)
 
+    subject_labels = classify_subjects(df['mail_object'])
+    df['subject_type'] = subject_labels['subject_type']
+    df['subject_language'] = subject_labels['subject_language']
+    without_response_pattern = df['subject_type'] == 'none'
+
     potential_automatic_email_ids = \
     df[(df['is_influencer_reply']) &
-       ((df['timestamp_difference'] <= MIN_RESPONSE_TIME) |
-       ~(df['mail_object'].str.contains('|'.join(RESPONSE_PATTERNS), flags=re.IGNORECASE, regex=True) == True))].index
+       ((df['timestamp_difference'] <= MIN_RESPONSE_TIME) | without_response_pattern)].index
 
+    nb_influencer_replies = max(df[df['is_influencer_reply']].shape[0], 1)
     logging.info(f"Number of potential automatic responses : {len(potential_automatic_email_ids)}")
     logging.info(f"% of potential automatic responses :\ "
-                 f"{100*len(potential_automatic_email_ids) / df[df['is_influencer_reply']].shape[0]:.2f} %")
-
-    tmp = df[(df['is_influencer_reply']) &
-             ~(df['mail_object'].str.contains('|'.join(RESPONSE_PATTERNS), flags=re.IGNORECASE, regex=True) == True)]
-
-    logging.info(f"% reponses without re and fwd : {100*len(tmp) / df[df['is_influencer_reply']].shape[0]:.2f}%")
+                 f"{100*len(potential_automatic_email_ids) / nb_influencer_replies:.2f} %")
+    logging.info(f"% reponses without re and fwd : "
+                 f"{100*(df['is_influencer_reply'] & without_response_pattern).sum() / nb_influencer_replies:.2f}%")
 
     df.drop(index=potential_automatic_email_ids, inplace=True)
     df.reset_index(inplace=True, drop=True)
@@ -168,52 +327,124 @@ def clean_merged_emails_dataframe(df):
 
     return df
 
+def first_mail_and_response_masks(cleaned_df):
+    """
+    First message of each thread and first mail and response mask (the first message and the
+    first later influencer reply), df must be sorted by thread_id then created_at.
+    """
+    first_in_thread = (cleaned_df['thread_id'] != cleaned_df['thread_id'].shift()).fillna(True).values.astype(bool)
+    replies = cleaned_df['is_influencer_reply'].values.astype(bool) & ~first_in_thread
+    # Replies seen so far minus the ones seen before the thread start : rank of the reply in its thread
+    replies_cumsum = np.cumsum(replies)
+    thread_segments = np.cumsum(first_in_thread) - 1
+    replies_before_thread = (replies_cumsum - replies)[first_in_thread][thread_segments]
+    first_replies = replies & (replies_cumsum - replies_before_thread == 1)
+
+    return first_in_thread, first_in_thread | first_replies
+
+@instrumented()
 def keep_only_first_mail_and_response(cleaned_df):
-    authorized_mails_ids = []
-    first_reply_found = False
-
-    previous_thread = -1
-
-    for id, thread_id, is_influencer_reply in cleaned_df[['id', 'thread_id', 'is_influencer_reply']].values:
-        if thread_id != previous_thread:
-            authorized_mails_ids.append(id)
-            previous_thread = thread_id
-            first_reply_found = False
-        else:
-            if is_influencer_reply and not first_reply_found:
-                authorized_mails_ids.append(id)
-                first_reply_found = True
-
-    authorized_mails_ids = set(authorized_mails_ids)
-    cleaned_df = cleaned_df[cleaned_df['id'].isin(authorized_mails_ids)]
+    _, first_mail_and_response = first_mail_and_response_masks(cleaned_df)
+    cleaned_df = cleaned_df[first_mail_and_response]
     cleaned_df.reset_index(inplace=True, drop=True)
 
     return cleaned_df
 
+def mailing_stats(cleaned_df, masks=None):
+    """
+    Per mailing (holder_id) statistics of a thread sorted cleaned frame, from one pass of
+    segment reductions. nb_threads, nb_sent_mails, nb_answered_mails and response_rate are
+    computed on the first mail and response of each thread only (keep_mailings_min_threads counts
+    every row), median_reply_latency is the median timestamp_difference of these responses and
+    nb_threads_<k>_replies the histogram of influencer replies per thread.
+    """
+    first_in_thread, first_mail_and_response = masks if masks is not None else \
+        first_mail_and_response_masks(cleaned_df)
+    holder_codes, holder_ids = pd.factorize(cleaned_df['holder_id'], sort=True)
+    nb_holders = len(holder_ids)
+    is_reply = cleaned_df['is_reply'].values.astype(bool)
+    is_influencer_reply = cleaned_df['is_influencer_reply'].values.astype(bool)
+    answered_mail = cleaned_df['answered_mail'].values.astype(bool)
+
+    sent_mails = first_mail_and_response & ~is_influencer_reply
+    nb_threads = np.bincount(holder_codes[first_mail_and_response & ~is_reply], minlength=nb_holders)
+    nb_sent_mails = np.bincount(holder_codes[sent_mails], minlength=nb_holders)
+    nb_answered_mails = np.bincount(holder_codes[sent_mails & answered_mail], minlength=nb_holders)
+
+    first_replies = first_mail_and_response & ~first_in_thread
+    median_reply_latency = pd.Series(cleaned_df['timestamp_difference'].values[first_replies])\
+        .groupby(holder_codes[first_replies]).median().reindex(range(nb_holders)).values
+
+    thread_segments = np.cumsum(first_in_thread) - 1
+    replies_per_thread = np.bincount(thread_segments, weights=is_influencer_reply & ~first_in_thread,
+                                     minlength=first_in_thread.sum()).astype(int)
+    histogram_bins = np.minimum(replies_per_thread, REPLIES_HISTOGRAM_SIZE - 1)
+    replies_histogram = np.bincount(holder_codes[first_in_thread] * REPLIES_HISTOGRAM_SIZE + histogram_bins,
+                                    minlength=nb_holders * REPLIES_HISTOGRAM_SIZE)\
+        .reshape(nb_holders, REPLIES_HISTOGRAM_SIZE)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats_df = pd.DataFrame({
+            'nb_threads': nb_threads,
+            'nb_sent_mails': nb_sent_mails,
+            'nb_answered_mails': nb_answered_mails,
+            'response_rate': nb_answered_mails / nb_sent_mails,
+            'median_reply_latency': median_reply_latency
+        }, index=pd.Index(holder_ids, name='holder_id'))
+    for nb_replies in range(REPLIES_HISTOGRAM_SIZE):
+        stats_df[REPLIES_HISTOGRAM_COLUMNS[nb_replies]] = replies_histogram[:, nb_replies]
+
+    return stats_df
+
+@instrumented()
+def aggregate_threads(cleaned_df):
+    """
+    First mail and response of each thread and per mailing statistics of the cleaned frame,
+    see mailing_stats.
+    """
+    masks = first_mail_and_response_masks(cleaned_df)
+    stats_df = mailing_stats(cleaned_df, masks)
+    first_df = cleaned_df[masks[1]]
+    first_df.reset_index(inplace=True, drop=True)
+
+    return first_df, stats_df
+
+def mailings_counts(cleaned_df):
+    """
+    Additive per mailing counts behind keep_mailings_min_threads statistics, they can be
+    summed over disjoint sets of threads.
+    """
+    sent_mails = ~cleaned_df['is_influencer_reply']
+    counts = pd.DataFrame({
+        'holder_id': cleaned_df['holder_id'],
+        'nb_threads': ~cleaned_df['is_reply'],
+        'nb_sent_mails': sent_mails,
+        'nb_answered_mails': sent_mails & cleaned_df['answered_mail']
+    }).groupby('holder_id').sum()
+
+    return counts.astype(int)
+
+@instrumented()
 def keep_mailings_min_threads(cleaned_df, nb_min_threads, mailings_df=None):
-    thread_count = cleaned_df[~cleaned_df['is_reply']].groupby('holder_id')['thread_id'].count()
-    authorized_holder_ids = list(thread_count[thread_count >= nb_min_threads].index)
-
-    cleaned_df = cleaned_df[cleaned_df['holder_id'].isin(authorized_holder_ids)]
+    """
+    nb_threads, nb_sent_mails and nb_answered_mails count every row of cleaned_df (see
+    mailings_counts), the first mail and response statistics are those of aggregate_threads.
+    """
+    counts_df = mailings_counts(cleaned_df)
+    counts_df = counts_df[(counts_df['nb_threads'] > 0) & (counts_df['nb_threads'] >= nb_min_threads)]
+
+    cleaned_df = cleaned_df[cleaned_df['holder_id'].isin(counts_df.index)]
     cleaned_df.reset_index(inplace=True, drop=True)
 
     if mailings_df is not None:
-        remaining_holder_ids = cleaned_df['holder_id'].unique()
-        average_answered_mails = cleaned_df[~cleaned_df['is_influencer_reply']].groupby('holder_id')\
-        ['answered_mail'].mean().sort_values()
-        nb_answered_mails = cleaned_df[~cleaned_df['is_influencer_reply']].groupby('holder_id')\
-        ['answered_mail'].sum().sort_values()
-        mailings_df = \
-            pd.merge(
-                mailings_df[mailings_df['id'].isin(remaining_holder_ids)],
-                pd.DataFrame({'id': average_answered_mails.index, 'response_rate': average_answered_mails.values}))
-        mailings_df = \
-            pd.merge(
-                mailings_df[mailings_df['id'].isin(remaining_holder_ids)],
-                pd.DataFrame({'id': nb_answered_mails.index, 'nb_answered_mails': nb_answered_mails.values}))
-        thread_count = thread_count.reset_index()
-        thread_count.columns = ['holder_id', 'nb_threads']
-        mailings_df = pd.merge(mailings_df, thread_count, left_on='id', right_on='holder_id')
+        counts_df = counts_df[counts_df['nb_sent_mails'] > 0]
+        mailings_df = pd.merge(mailings_df, pd.DataFrame({
+            'id': counts_df.index.values,
+            'response_rate': (counts_df['nb_answered_mails'] / counts_df['nb_sent_mails']).values,
+            'nb_answered_mails': counts_df['nb_answered_mails'].values,
+            'holder_id': counts_df.index.values,
+            'nb_threads': counts_df['nb_threads'].values
+        }))
 
         return cleaned_df, mailings_df
 
@@ -0,0 +1,88 @@
+import random
+import numpy as np
+import pandas as pd
+from emoji import UNICODE_EMOJI
+
+# Seeded templated emails for the benchmarks and tests : merge fields, pronouns, company names,
+# currencies, call to actions, urls, html tags and images
+WORDS = ['hi', 'hello', '{{first_name}}', '{{influencer_name}}', '{{instagram_name}}', '{{price}}', 'we', 'i',
+         'you', 'they', 'he', 'our', 'brand', 'acme', '$', '€', 'love', 'your', 'work.', 'great!', 'click', 'apply',
+         'join', 'us,', 'contact', 'me', 'at', 'a@b.com.', 'https://x.com', 'collaboration', 'campaign', 'followers',
+         'paid', 'partnership']
+TAGS = ['<p>', '</p>', '<div>', '</div>', '<br>', '<b>', '</b>', '<img src="a.png" width="10" height="20">',
+        '<img src="b.png">']
+COMPANIES = [None, 'Acme', 'Brand.Co']
+
+def random_emails(nb_emails, seed=0, min_body_words=0, max_body_words=120, tags_ratio=0.15):
+    """
+    templated_body, templated_object, company_name and company_name_lower DataFrame.
+    Every 11th object is missing.
+    """
+    generator = random.Random(seed)
+    bodies, objects = [], []
+    for i in range(nb_emails):
+        bodies.append(' '.join(generator.choice(TAGS) if generator.random() < tags_ratio else generator.choice(WORDS)
+                               for _ in range(generator.randint(min_body_words, max_body_words))))
+        objects.append(None if i % 11 == 0 else ' '.join(generator.choice(WORDS)
+                                                         for _ in range(generator.randint(0, 8))))
+    df = pd.DataFrame({'templated_body': bodies, 'templated_object': objects,
+                       'company_name': [COMPANIES[i % len(COMPANIES)] for i in range(nb_emails)]})
+    df['company_name_lower'] = df['company_name'].str.lower()
+    return df
+
+def random_emoji_texts(nb_texts, seed=0, emojis_ratio=0.1):
+    """
+    Generated bodies with emojis, multi codepoint ones included, between and inside words.
+    """
+    generator = random.Random(seed)
+    emojis = list(UNICODE_EMOJI.keys())
+    texts = []
+    for body in random_emails(nb_texts, seed=seed)['templated_body']:
+        words = body.split(' ')
+        for _ in range(int(len(words) * emojis_ratio)):
+            i = generator.randrange(len(words))
+            words[i] = generator.choice(['', words[i]]) + generator.choice(emojis) + generator.choice(['', 'x', '!'])
+        texts.append(' '.join(words))
+    return texts
+
+SUBJECTS = ['Hello', 'Collaboration with Acme', 'Re: hello', 'RE : paid partnership', 'Fwd: campaign', 'TR: brief',
+            'Aw: Kooperation', '回复: 合作', 'Antw: samenwerking', 'Quick question', 'Your followers', 'Price']
+EMAILS_TSV_COLUMNS = ['id', 'thread_id', 'object', 'templated_body', 'templated_object', 'response', 'created_by',
+                      'headers', 'created_at', 'updated_at']
+
+def random_subjects(nb_subjects, seed=0, nb_distinct=None):
+    """
+    Reply / forward prefixed subjects in several languages, plain ones and missing ones, made
+    distinct by a number up to nb_distinct when given.
+    """
+    generator = np.random.default_rng(seed)
+    subjects = pd.Series(np.array(SUBJECTS + [None], dtype=object)[generator.integers(0, len(SUBJECTS) + 1,
+                                                                                      nb_subjects)])
+    if nb_distinct is not None:
+        subjects = subjects + ' #' + pd.Series(generator.integers(0, nb_distinct, nb_subjects)).astype(str)
+    return subjects
+
+def write_emails_tsv(path, nb_emails, seed=0, nb_threads=None, chunk_size=100000):
+    """
+    Emails export TSV with short bodies and an unused headers column, written by chunks.
+    """
+    generator = np.random.default_rng(seed)
+    nb_threads = nb_threads if nb_threads is not None else max(nb_emails // 4, 1)
+    start = pd.Timestamp('2021-01-01')
+    for chunk_start in range(0, max(nb_emails, 1), chunk_size):
+        size = min(chunk_size, nb_emails - chunk_start)
+        created_at = start + pd.to_timedelta(generator.integers(0, 365 * 24 * 3600, size), unit='s')
+        df = pd.DataFrame({
+            'id': np.arange(chunk_start, chunk_start + size),
+            'thread_id': generator.integers(0, nb_threads, size),
+            'object': random_subjects(size, seed=seed + chunk_start).values,
+            'templated_body': np.array(['<p>Hi {{first_name}}, we love your work.</p>',
+                                        '<p>Our brand would pay $100 for a post</p>'])[generator.integers(0, 2, size)],
+            'templated_object': 'Collab {{influencer_name}}',
+            'response': generator.random(size) < 0.3,
+            'created_by': generator.integers(0, 50, size),
+            'headers': 'x-mailer: upfluence',
+            'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S.%f'),
+            'updated_at': created_at.strftime('%Y-%m-%d %H:%M:%S.%f')
+        }, columns=EMAILS_TSV_COLUMNS)
+        df.to_csv(path, sep='\t', index=False, header=chunk_start == 0, mode='w' if chunk_start == 0 else 'a')
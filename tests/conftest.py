@@ -0,0 +1,18 @@
+import os
+import sys
+
+# The modules are imported as siblings (from html_utils import ...), as in the scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nltk
+import pytest
+
+@pytest.fixture
+def sentence_tokenizer():
+    """
+    Skips tests needing the nltk sentence tokenizer data : punkt_tab since nltk 3.8.2, punkt before.
+    """
+    try:
+        nltk.tokenize.sent_tokenize('Hi. Hello.')
+    except LookupError:
+        pytest.skip("nltk punkt_tab (or punkt) data is not installed")
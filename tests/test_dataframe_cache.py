@@ -0,0 +1,36 @@
+import os
+import json
+from dataframe_cache import invalidate_stale_entries, cache_key, MANIFEST_FILE
+
+def write_entry(cache_dir, entry, manifest=None):
+    entry_dir = os.path.join(cache_dir, entry)
+    os.makedirs(entry_dir)
+    if manifest is not None:
+        with open(os.path.join(entry_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f)
+    return entry_dir
+
+def test_invalidate_stale_entries_keeps_other_directories(tmp_path):
+    manifest = {'inputs': [['/data/mailings.tsv', 1, 1]], 'window': ['2021-01-01', '2021-02-01']}
+    stale_manifest = {'inputs': [['/data/mailings.tsv', 2, 2]], 'window': ['2021-01-01', '2021-02-01']}
+    other_window_manifest = {'inputs': [['/data/mailings.tsv', 1, 1]], 'window': ['2020-01-01', '2021-02-01']}
+    key = cache_key(manifest)
+    stale_key = cache_key(stale_manifest)
+
+    kept = [
+        write_entry(tmp_path, key, manifest),
+        write_entry(tmp_path, cache_key(other_window_manifest), other_window_manifest),
+        # In-flight entry of another process and unrelated directories, with no manifest
+        write_entry(tmp_path, stale_key + '.tmp'),
+        write_entry(tmp_path, 'notes'),
+        write_entry(tmp_path, 'ABCDEF0123456789')
+    ]
+    removed = [
+        write_entry(tmp_path, stale_key, stale_manifest),
+        # Entry without manifest
+        write_entry(tmp_path, '0123456789abcdef')
+    ]
+
+    invalidate_stale_entries(tmp_path, manifest, key)
+    assert all(os.path.isdir(entry_dir) for entry_dir in kept)
+    assert not any(os.path.exists(entry_dir) for entry_dir in removed)
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+from feature_engineering import text_features, email_featurizer, featurize_email, TEXT_INTERMEDIATE_COLUMNS
+from synthetic_emails import random_emails
+
+NB_EMAILS = 300
+
+def test_featurize_email_matches_text_features(sentence_tokenizer):
+    df = random_emails(NB_EMAILS, seed=1)
+    batch_df = text_features(df.copy())
+
+    columns = email_featurizer().columns
+    assert columns == [col for col in batch_df.columns if col not in df.columns and
+                       col not in TEXT_INTERMEDIATE_COLUMNS]
+    online = [featurize_email(body, subject, company) for body, subject, company in
+              zip(df['templated_body'], df['templated_object'], df['company_name'])]
+    online_df = pd.DataFrame([features for features in online if features is not None], columns=columns)
+    assert len(online_df) == len(batch_df)
+
+    for col in columns:
+        batch_values, online_values = batch_df[col].values, online_df[col].values
+        if batch_values.dtype.kind in 'fiub' and online_values.dtype.kind in 'fiub':
+            assert np.array_equal(batch_values.astype(float), online_values.astype(float), equal_nan=True), col
+        else:
+            assert list(pd.Series(batch_values).astype(str)) == list(pd.Series(online_values).astype(str)), col
@@ -0,0 +1,41 @@
+import random
+from html_utils import ParsedMailBody, StreamedMailBody
+
+NB_BODIES = 5000
+MAX_PIECES = 40
+# Html fragments exercising the BeautifulSoup rules emulated by MailBodyEventsParser : string
+# containers, empty elements, unmatched end tags, references, comments, declarations, CDATA
+BODY_PIECES = [
+    '<p>', '</p>', '<div class="a">', '</div>', '<br>', '<br/>', '</br>', '<img src="a.png" width=10>',
+    '<img src=b height="5" height="6">', '</img>', '<img srcset="c.png 200w" style="height: 20px">', '<pre>', '</pre>',
+    '<textarea>', '</textarea>', '<script>var a="<p>";</script>', '<style>p{}</style>', '<style>', '<script>',
+    '<template>', '</template>', '<rt>', '</rt>', '<rp>', '</rp>', '<!-- c -->', '<!DOCTYPE html>', '<![CDATA[x y]]>',
+    '<?xml x?>', '&amp;', '&nbsp;', '&#233;', '&#x41;', '&#150;', '&#12ab;', '&#xzz;', '&unknown;', '&amp', '&', '<',
+    '>', ' ', '\n', '  \n ', '\t', 'Hello', '{{first_name}}', 'word.', '\xa0', '<span>', '</span>', '<b/>', '<a href=x>',
+    '</a>', '<table><tr><td>', '</td></tr></table>', '</ div>', '<p', 'x<y', '<img>', '<input disabled>', '<IMG SRC="C">',
+    '<svg><image href=a/></svg>'
+]
+
+def random_bodies(seed, nb_bodies=NB_BODIES):
+    generator = random.Random(seed)
+    return [''.join(generator.choice(BODY_PIECES) for _ in range(generator.randint(0, MAX_PIECES)))
+            for _ in range(nb_bodies)]
+
+def document_outputs(document):
+    images = [{key: ' '.join(value) if isinstance(value, list) else value for key, value in dict(img.attrs).items()}
+              if hasattr(img, 'attrs') else img for img in document.get_images()]
+    return document.get_text(), document.get_tags_number(), images
+
+def test_stream_backend_matches_soup_backend():
+    mismatches = []
+    for body in random_bodies(seed=1):
+        if document_outputs(StreamedMailBody(body)) != document_outputs(ParsedMailBody(body)):
+            mismatches.append(body)
+    assert mismatches == [], f"{len(mismatches)} bodies differ, e.g. {mismatches[:3]!r}"
+
+def test_stream_backend_matches_soup_backend_on_mail_like_bodies():
+    bodies = ['', 'plain text', '<html><head><style>p{}</style></head><body><p>Hi {{first_name}},</p>'
+              '<p>We&nbsp;love &amp; <b>your</b> work</p><img src="x.png" width="100" height="50"></body></html>',
+              '<div>unclosed <span>tags <p>everywhere', '<pre>  keep\n  spaces </pre> <textarea> a  b </textarea>']
+    for body in bodies:
+        assert document_outputs(StreamedMailBody(body)) == document_outputs(ParsedMailBody(body))
@@ -0,0 +1,21 @@
+import pandas as pd
+from identities import normalize_email, normalize_emails, categories_lookup
+from process_dataframe import INBOX_DEMO_MAILS, INBOX_DEMO_NORMALIZED_MAILS
+
+EMAILS = ['Siobhan.Donovan+1@upfluence.com', 'siobhan.donovan@upfluence.com', 'a+b+c@x.com', 'A@X.COM', 'plus+@x.com',
+          None, 'no-at+tag', 'siobhan.donovan+1@upfluence.com']
+
+def test_normalize_emails_matches_normalize_email():
+    serie = pd.Series(EMAILS, name='user_email')
+    for strip_tags in [False, True]:
+        normalized = normalize_emails(serie, strip_tags)
+        assert normalized.name == 'user_email'
+        assert list(normalized.astype(object).where(normalized.notna(), None)) == \
+            [normalize_email(email, strip_tags) if email is not None else None for email in EMAILS]
+
+def test_inbox_demo_mails_lookup_after_normalization():
+    serie = pd.Series(EMAILS)
+    for strip_tags in [False, True]:
+        is_demo = categories_lookup(normalize_emails(serie, strip_tags), INBOX_DEMO_NORMALIZED_MAILS)
+        assert list(is_demo) == [True, True, False, False, False, False, False, True]
+    assert INBOX_DEMO_MAILS <= INBOX_DEMO_NORMALIZED_MAILS
@@ -0,0 +1,63 @@
+import struct
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pytest
+from html_utils import MailBodyAnalyzer
+from image_probe import probe_image_sizes
+
+PNG = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', 640, 480) + b'\x08\x06\x00\x00\x00'
+GIF = b'GIF89a' + struct.pack('<HH', 120, 60) + b'\x00' * 20
+# SOI, an APP0 segment to skip, then a baseline start of frame
+JPEG = b'\xff\xd8' + b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + b'\x00' * 9 + \
+    b'\xff\xc0' + struct.pack('>HBHH', 17, 8, 300, 400) + b'\x00' * 20
+FILES = {'/a.png': PNG + b'\x00' * 5000, '/b.gif': GIF, '/c.jpg': JPEG, '/text': b'not an image ' * 10}
+
+class ImagesHandler(BaseHTTPRequestHandler):
+    requested_paths = []
+
+    def do_GET(self):
+        self.requested_paths.append(self.path)
+        if self.path not in FILES:
+            self.send_error(500 if self.path == '/error' else 404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(FILES[self.path])))
+        self.end_headers()
+        self.wfile.write(FILES[self.path])
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def images_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ImagesHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    ImagesHandler.requested_paths = []
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+def test_probe_image_sizes_local_server(images_server, tmp_path):
+    urls = [images_server + path for path in ['/a.png', '/b.gif', '/c.jpg', '/text', '/error', '/missing']]
+    bodies = [f'<p>hi</p><img src="{urls[0]}"><img src="{urls[1]}" width="50">',
+              f'<img src="{urls[2]}" height="10">' + ''.join(f'<img src="{url}">' for url in urls[3:]),
+              # Complete dimensions are not probed
+              f'<img src="{images_server}/complete.png" width="1" height="2">', None]
+    cache_path = str(tmp_path / 'image_sizes.sqlite')
+
+    sizes = probe_image_sizes(bodies, cache_path)
+    assert sizes == {urls[0]: (640, 480), urls[1]: (120, 60), urls[2]: (400, 300),
+                     urls[3]: None, urls[4]: None, urls[5]: None}
+    assert sorted(ImagesHandler.requested_paths) == sorted(['/a.png', '/b.gif', '/c.jpg', '/text', '/error',
+                                                            '/missing'])
+
+    # Sizes and failures are served from the sqlite cache
+    assert probe_image_sizes(bodies, cache_path) == sizes
+    assert len(ImagesHandler.requested_paths) == 6
+
+    # The probed size replaces both dimensions, as the former per image fetch did
+    images = MailBodyAnalyzer(bodies[1], image_sizes=sizes).get_images_array()
+    assert (images['width'][0], images['height'][0]) == (400, 300)
+    assert np.isnan(images['width'][1:]).all() and np.isnan(images['height'][1:]).all()
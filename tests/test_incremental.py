@@ -0,0 +1,35 @@
+import pandas as pd
+from process_dataframe import mailings_counts, keep_mailings_min_threads
+from incremental import IncrementalState, update_counts
+
+def cleaned_rows(holder_id, thread_id, rows):
+    """
+    (is_reply, is_influencer_reply, answered_mail) rows of a thread.
+    """
+    return pd.DataFrame([{'holder_id': holder_id, 'thread_id': thread_id, 'is_reply': is_reply,
+                          'is_influencer_reply': is_influencer_reply, 'answered_mail': answered_mail}
+                         for is_reply, is_influencer_reply, answered_mail in rows])
+
+def test_mailings_stats_matches_batch_after_removed_rows():
+    first_mail, response, unanswered = (False, False, True), (True, True, True), (False, False, False)
+    cleaned_df = pd.concat([
+        cleaned_rows(1, 10, [first_mail, response]),
+        cleaned_rows(1, 11, [unanswered]),
+        # Every row of holder 2 is removed
+        cleaned_rows(2, 20, [first_mail, response]),
+        # The first mails of holder 3 are removed, its responses are kept
+        cleaned_rows(3, 30, [first_mail, response]),
+        cleaned_rows(3, 31, [first_mail, (True, False, True)]),
+        cleaned_rows(4, 40, [unanswered])
+    ], ignore_index=True)
+    removed = (cleaned_df['holder_id'] == 2) | ((cleaned_df['holder_id'] == 3) & ~cleaned_df['is_reply'])
+    mailings_df = pd.DataFrame({'id': [1, 2, 3, 4], 'name': ['a', 'b', 'c', 'd']})
+
+    state = IncrementalState(None)
+    state.counts_df = update_counts(mailings_counts(cleaned_df), cleaned_df[removed], cleaned_df.iloc[:0])
+    for nb_min_threads in [0, 1, 2]:
+        _, batch_df = keep_mailings_min_threads(cleaned_df[~removed], nb_min_threads, mailings_df)
+        incremental_df = state.mailings_stats(mailings_df, nb_min_threads)
+        pd.testing.assert_frame_equal(incremental_df.sort_values('id').reset_index(drop=True),
+                                      batch_df.sort_values('id').reset_index(drop=True), check_dtype=False)
+        assert set(incremental_df['id']) <= {1, 4}
@@ -0,0 +1,37 @@
+import random
+from collections import Counter
+from textblob import TextBlob
+from lexicon import LexiconVectorizer, LEXICON
+
+NB_TEXTS = 1000
+WORDS = [term for terms in LEXICON.values() for term in terms if term.isalnum()] + ['hello', 'made', 'e', 'x', '5']
+# Punctuation around words : stripped by TextBlob, nltk separators, contractions and quotes
+PUNCTUATION = list("-./,:;!?()'\"$&*_[]") + ['--', '...', "'s", "'ll", "'m", "n't", '€', '£', '’', '“']
+
+def random_texts(seed, nb_texts=NB_TEXTS):
+    generator = random.Random(seed)
+    punctuation = lambda: ''.join(generator.choice(PUNCTUATION) for _ in range(generator.choice([0, 0, 1, 2])))
+    texts = []
+    for _ in range(nb_texts):
+        tokens = [''.join(punctuation() + generator.choice(WORDS) for _ in range(generator.randint(1, 3))) +
+                  punctuation() for _ in range(generator.randint(0, 30))]
+        texts.append(' '.join(tokens))
+    return texts
+
+def lexicon_words_counts(vectorizer, texts):
+    terms = list(vectorizer.vocabulary)
+    counts = vectorizer.transform(texts).toarray()
+    return [Counter({term: count for term, count in zip(terms, row) if count and term.isalnum()}) for row in counts]
+
+def textblob_words_counts(vectorizer, texts):
+    return [Counter(word for word in TextBlob(text).words if word.isalnum() and word in vectorizer.vocabulary)
+            for text in texts]
+
+def test_lexicon_words_match_textblob_words(sentence_tokenizer):
+    vectorizer = LexiconVectorizer()
+    texts = ["-we go", "-he's x", "i/ go", "hi you/", "they/ x", "you/me self-made i.e.", "(we) we, we,5 we.5",
+             "'we x'we -'we '-we", "we'll i'm he'x youn't", "him'm' x"] + random_texts(seed=1)
+    mismatches = [(text, expected, counts) for text, expected, counts in
+                  zip(texts, textblob_words_counts(vectorizer, texts), lexicon_words_counts(vectorizer, texts))
+                  if expected != counts]
+    assert mismatches == [], f"{len(mismatches)} texts differ, e.g. {mismatches[:3]!r}"
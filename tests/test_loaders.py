@@ -0,0 +1,35 @@
+import datetime
+import importlib.util
+import pandas as pd
+import pytest
+from process_dataframe import load_emails_inbox_dataframe
+from synthetic_emails import write_emails_tsv
+
+NB_EMAILS = 2000
+START, END = pd.Timestamp('2021-03-01'), pd.Timestamp('2021-09-01')
+
+@pytest.fixture
+def emails_path(tmp_path):
+    path = str(tmp_path / 'emails.tsv')
+    write_emails_tsv(path, NB_EMAILS, seed=3, nb_threads=100, chunk_size=700)
+    return path
+
+def test_loaders_engines_and_chunks_match(emails_path):
+    threads_ids = list(range(0, 100, 3))
+    expected_df = load_emails_inbox_dataframe(emails_path, START, END, threads_ids, engine='c')
+    assert len(expected_df) > 0
+    pd.testing.assert_frame_equal(
+        load_emails_inbox_dataframe(emails_path, START, END, threads_ids, engine='c', chunk_size=300), expected_df)
+    if importlib.util.find_spec('pyarrow') is not None:
+        pd.testing.assert_frame_equal(
+            load_emails_inbox_dataframe(emails_path, START, END, threads_ids, engine='pyarrow'), expected_df)
+
+def test_loader_matches_baseline_parsing(emails_path):
+    df = load_emails_inbox_dataframe(emails_path, pd.Timestamp.min, pd.Timestamp.max, None)
+    raw_df = pd.read_csv(emails_path, sep='\t')
+    assert list(df['id']) == list(raw_df['id'])
+    assert list(df['thread_id']) == list(raw_df['thread_id'])
+    assert list(df['mail_object']) == list(raw_df['object'].fillna(''))
+    for col in ['created_at', 'updated_at']:
+        assert list(df[col]) == [datetime.datetime.strptime(x, '%Y-%m-%d %H:%M:%S.%f') for x in raw_df[col]]
+    assert 'headers' not in df.columns
@@ -0,0 +1,11 @@
+import pandas as pd
+from feature_engineering import text_features, parallel_text_features
+from synthetic_emails import random_emails
+
+NB_EMAILS = 120
+CHUNK_SIZE = 25
+
+def test_parallel_text_features_matches_text_features(sentence_tokenizer):
+    df = random_emails(NB_EMAILS, seed=2)
+    pd.testing.assert_frame_equal(parallel_text_features(df.copy(), n_jobs=2, chunk_size=CHUNK_SIZE),
+                                  text_features(df.copy()))
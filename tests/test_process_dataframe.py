@@ -0,0 +1,130 @@
+import time
+import random
+import numpy as np
+import pandas as pd
+from process_dataframe import compute_thread_sequences, classify_subjects, SUBJECT_PATTERNS_REGEXP
+from synthetic_emails import random_subjects
+
+NB_THREADS = 500
+MAX_THREAD_MAILS = 8
+NB_SUBJECTS = 5000
+# The joined patterns clean_merged_emails_dataframe used to filter responses with
+BASELINE_RESPONSE_PATTERNS = ['re:', '回复:', '回覆:', 'sv:', 'antw:', 'vs:', 'ref:', 'aw:', 'ΑΠ:', 'bls:', 'res:', 'odp:',
+                              'ynt:']
+BASELINE_RESPONSE_PATTERNS += ['fw:', '轉寄:', '轉寄:', 'vs:', 'doorst:', 'vl:', 'tr:', 'wg:', 'ΠΡΘ:', 'trs:', 'vb:', 'rv:',
+                               'enc:', 'pd:', 'İLT']
+BASELINE_RESPONSE_PATTERNS += [r[:-1] + ' :' for r in BASELINE_RESPONSE_PATTERNS]
+
+def baseline_thread_sequences(df):
+    """
+    Row by row is_reply and time_difference loops compute_thread_sequences replaced.
+    """
+    previous_thread = -1
+    previous_time = -1
+    time_diff = []
+
+    for thread_id, created_at in df[['thread_id', 'created_at']].values:
+        if thread_id != previous_thread:
+            time_diff.append(created_at)
+            previous_thread = thread_id
+        else:
+            time_diff.append(previous_time)
+        previous_time = created_at
+
+    previous_thread = -1
+    previous_reply_type = -1
+    is_reply = []
+
+    for thread_id, is_inf_reply in df[['thread_id', 'is_influencer_reply']].values:
+        if thread_id != previous_thread:
+            is_reply.append(False)
+            previous_thread = thread_id
+        else:
+            if previous_reply_type != is_inf_reply:
+                is_reply.append(True)
+            else:
+                is_reply.append(False)
+        previous_reply_type = is_inf_reply
+
+    df['is_reply'] = is_reply
+    df['time_difference'] = df['created_at'] - pd.Series(time_diff)
+    df['timestamp_difference'] = df['created_at'].apply(lambda x: x.timestamp()) - \
+                                 pd.Series(time_diff).apply(lambda x: x.timestamp())
+    return df
+
+def random_threads(seed, nb_threads=NB_THREADS):
+    """
+    Emails sorted by thread_id then created_at: single mail threads, runs of the same reply
+    type, and consecutive threads whose boundary mails have the same or another reply type.
+    """
+    generator = random.Random(seed)
+    start = pd.Timestamp('2020-01-01')
+    rows = []
+    for thread_id in range(nb_threads):
+        nb_mails = 1 if thread_id % 5 == 0 else generator.randint(1, MAX_THREAD_MAILS)
+        created_at = start + pd.Timedelta(seconds=generator.randint(0, 10 ** 7))
+        is_influencer_reply = generator.random() < 0.3
+        for _ in range(nb_mails):
+            rows.append({'thread_id': thread_id, 'created_at': created_at, 'is_influencer_reply': is_influencer_reply})
+            created_at += pd.Timedelta(seconds=generator.randint(0, 10 ** 5))
+            if generator.random() < 0.5:
+                is_influencer_reply = not is_influencer_reply
+    return pd.DataFrame(rows)
+
+def assert_same_thread_sequences(df):
+    expected_df = baseline_thread_sequences(df.copy())
+    computed_df = compute_thread_sequences(df.copy())
+    assert list(computed_df['is_reply']) == list(expected_df['is_reply'])
+    pd.testing.assert_series_equal(computed_df['time_difference'], expected_df['time_difference'])
+    assert np.allclose(computed_df['timestamp_difference'], expected_df['timestamp_difference'], rtol=0, atol=1e-6)
+
+def test_compute_thread_sequences_matches_baseline_loops():
+    assert_same_thread_sequences(random_threads(seed=1))
+
+def test_compute_thread_sequences_edge_cases():
+    times = pd.to_datetime(['2020-01-01 10:00', '2020-01-01 11:00', '2020-01-01 12:00', '2020-01-02 09:00',
+                            '2020-01-02 09:30', '2020-01-03 08:00', '2020-01-03 08:00'])
+    df = pd.DataFrame({
+        # Single mail thread, repeated reply type, boundaries with the same reply type, equal timestamps
+        'thread_id': [1, 2, 2, 3, 3, 4, 4],
+        'created_at': times,
+        'is_influencer_reply': [False, False, False, False, True, True, True]
+    })
+    assert_same_thread_sequences(df)
+    assert list(compute_thread_sequences(df.copy())['is_reply']) == [False, False, False, False, True, False, False]
+    assert_same_thread_sequences(df.iloc[:1].reset_index(drop=True))
+
+def test_compute_thread_sequences_across_dst_changes(monkeypatch):
+    """
+    timestamp_difference is the elapsed time_difference, whatever the local timezone : naive
+    created_at are wall clock times, so a reply 2 hours later on the clock counts 2 hours.
+    """
+    monkeypatch.setenv('TZ', 'Europe/Paris')
+    time.tzset()
+    try:
+        times = pd.to_datetime(['2021-03-28 01:30', '2021-03-28 03:30', '2021-10-31 02:30', '2021-10-31 03:30'])
+        for created_at, expected in [(times, [0, 7200, 0, 3600]),
+                                     (times.tz_localize('Europe/Paris', ambiguous=[False, False, True, False]),
+                                      [0, 3600, 0, 7200])]:
+            df = pd.DataFrame({'thread_id': [1, 1, 2, 2], 'created_at': created_at,
+                               'is_influencer_reply': [False, True, False, True]})
+            assert_same_thread_sequences(df)
+            computed_df = compute_thread_sequences(df.copy())
+            assert list(computed_df['timestamp_difference']) == expected
+            assert list(computed_df['time_difference'].dt.total_seconds()) == expected
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+def test_classify_subjects_matches_baseline_regexp():
+    mail_objects = pd.concat([random_subjects(NB_SUBJECTS, seed=1, nb_distinct=100), pd.Series([
+        'İLT x', 'ilt', 'İlt', 'RE : hi', 'Re:', 'απ: x', 'ΑΠ :', 'FW:x', 'Fwd: x', 'no prefix', 'tr', 'tr :', '', None
+    ])], ignore_index=True)
+    labels_df = classify_subjects(mail_objects)
+
+    is_response = mail_objects.str.contains('|'.join(BASELINE_RESPONSE_PATTERNS), case=False, na=False)
+    assert list(labels_df['subject_type'] != 'none') == list(is_response)
+    # Same labels as a search of every subject with the full pattern
+    matches = [SUBJECT_PATTERNS_REGEXP.search(subject) if type(subject) == str else None for subject in mail_objects]
+    expected_labels = [match.lastgroup.split('_', 1) if match is not None else ['none', 'none'] for match in matches]
+    assert [list(labels) for labels in zip(labels_df['subject_type'], labels_df['subject_language'])] == expected_labels
@@ -0,0 +1,34 @@
+from emoji import UNICODE_EMOJI
+from text_processor import SocialMediaTokenizer
+from synthetic_emails import random_emails, random_emoji_texts
+from benchmark_tokenizer import baseline_word_regexp, baseline_tokenize
+
+NB_TEXTS = 300
+
+def test_iter_tokens_matches_baseline_emoji_alternation():
+    emojis = list(UNICODE_EMOJI.keys())
+    texts = ['hi 👋🏽 (you) | me', 'love it😍😍!', '#tag🔥 @name 🇫🇷x', ''.join(emojis[1030:1040]),
+             'a {{first_name}} ©® ‼ 1⃣ https://x.com'] + random_emoji_texts(NB_TEXTS, seed=1)
+    tokenizer = SocialMediaTokenizer()
+    regexp = baseline_word_regexp()
+    for text in texts:
+        normalized_text = tokenizer.normalize_text(text)
+        assert list(tokenizer.iter_tokens(normalized_text)) == baseline_tokenize(regexp, normalized_text), text
+
+def test_batch_apis_match_per_document_tokenizer():
+    texts = ['', 'Hi @name #tag https://instagram.com/x a@b.com {{price}} !!!!', '<p>caf&eacute; 😍</p>'] + \
+        list(random_emails(NB_TEXTS, seed=2, max_body_words=20)['templated_body'])
+    tokenizer = SocialMediaTokenizer(specify_url_type=True)
+    per_document = []
+    for text in texts:
+        document_tokenizer = SocialMediaTokenizer(text, specify_url_type=True)
+        document_tokenizer.tokenize()
+        per_document.append(document_tokenizer.tokens_)
+        document_tokenizer.process_text()
+        assert tokenizer.process(text) == document_tokenizer.clean_text_
+    assert tokenizer.process_batch(texts) == [tokenizer.process(text) for text in texts]
+
+    tokens, types, offsets = tokenizer.tokenize_batch(texts)
+    assert len(offsets) == len(texts) + 1
+    assert [list(zip(tokens[start:end], types[start:end])) for start, end in zip(offsets[:-1], offsets[1:])] == \
+        per_document
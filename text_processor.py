@@ -1,4 +1,6 @@
 import regex as re
+from functools import lru_cache
+import numpy as np
 from emoji import UNICODE_EMOJI
 from six import int2byte, unichr
 from six.moves import html_entities
@@ -17,7 +19,25 @@ ACCENTED_CHARACTERS = 'ÀàÁáÂâÃãÄäÇçÈèÉéÊêËëÌìÍíÎîÏï
 REMAINING_STRING = r"""([A-Za-z0-9%s_](?:(?:[A-Za-z0-9%s_]|(?:\.(?!\.))){0,28}(?:[A-Za-z0-9%s_]))?)|(?:[^\W\d_](?:[^\W\d_]|['\-_])+[^\W\d_])|(?:[+\-]?\d+[,/.:-]\d+[+\-]?)|(?:[\w_]+)|(?:\.(?:\s*\.){1,})|(?:\S)""" % (ACCENTED_CHARACTERS, ACCENTED_CHARACTERS, ACCENTED_CHARACTERS)
 PUNCTUATION = '!"$%&\'()*+,-./:;<=>?[\\]^_`{|}~•’@...”“'
 MERGE_FIELD_STRING = r"""{{.*?}}"""
-EMOJI_STRING = '[(' + '|'.join(list(UNICODE_EMOJI.keys())[:1035] + list(UNICODE_EMOJI.keys())[1037:]) + ')]+'
+
+def _emoji_character_class():
+    """
+    Character class of every codepoint used by an emoji, written as codepoint ranges.
+    '(', '|' and ')' come from the former '[(' + '|'.join(emojis) + ')]+' pattern and are kept
+    so that tokens do not change.
+    """
+    emojis = list(UNICODE_EMOJI.keys())
+    codepoints = sorted(set(ord(c) for emoji in emojis[:1035] + emojis[1037:] for c in emoji) | set(map(ord, '(|)')))
+    ranges = []
+    for codepoint in codepoints:
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    return '[' + ''.join('\\U%08x' % start if start == end else '\\U%08x-\\U%08x' % (start, end)
+                         for start, end in ranges) + ']+'
+
+EMOJI_STRING = _emoji_character_class()
 
 tokens_types = ['token', 'hashtag', 'mention', 'url', 'mail', 'merge_field', 'emoji']
 
@@ -32,7 +52,13 @@ REGEXP_STRINGS = {
 }
 
 HANG_REGEXP = re.compile(r'([^a-zA-Z0-9])\1{3,}')
-WORD_REGEXP = re.compile(r"""(%s)""" % "|".join(["(?P<{}>{})".format(i, v) for i, v in REGEXP_STRINGS.items()]), re.VERBOSE | re.I | re.UNICODE)
+
+@lru_cache(maxsize=None)
+def word_regexp():
+    # No enclosing group, so that match.lastgroup is the token type
+    return re.compile("|".join(["(?P<{}>{})".format(i, v) for i, v in REGEXP_STRINGS.items()]),
+                      re.VERBOSE | re.I | re.UNICODE)
+
 SPECIFIC_URLS = ['instagram', 'facebook', 'tiktok', 'youtube', 'paypal', 'amazon', 'bit.ly', 'generator.com', 'calendly']
 
 def _str_to_unicode(text, encoding=None, errors='strict'):
@@ -79,7 +105,7 @@ def _is_emoji(s):
 
 class SocialMediaTokenizer():
     def __init__(self,
-                 text,
+                 text='',
                  remove_html=True,
                  lower=True,
                  detect_emoji=True,
@@ -96,14 +122,8 @@ class SocialMediaTokenizer():
                  stopwords_list=None,
                  specify_url_type=False):
         self.lower = lower
-        self.clean_text_ = str(text)
-        if self.lower:
-            self.clean_text_ = self.clean_text_.lower()
-        self.clean_text_ = HTML_RE.sub('', self.clean_text_)
         self.remove_html = remove_html
-        if self.remove_html:
-            self.clean_text_ = _replace_html_entities(self.clean_text_)
-        self.clean_text_ = HANG_REGEXP.sub(r'\1\1\1', self.clean_text_)
+        self.clean_text_ = self.normalize_text(text)
         self.detect_emoji = detect_emoji
         self.detect_punctuation = detect_punctuation
         self.token = token
@@ -118,38 +138,38 @@ class SocialMediaTokenizer():
         self.stopwords_list = stopwords_list
         self.specify_url_type = specify_url_type
 
-    def tokenize(self):
+    def normalize_text(self, text):
+        text = str(text)
+        if self.lower:
+            text = text.lower()
+        text = HTML_RE.sub('', text)
+        if self.remove_html:
+            text = _replace_html_entities(text)
+        return HANG_REGEXP.sub(r'\1\1\1', text)
+
+    def iter_tokens(self, normalized_text):
         detect_punctuation = self.detect_punctuation
-        detect_emoji = self.detect_emoji
         stopwords_list = self.stopwords_list
         specify_url_type = self.specify_url_type
-        self.tokens_ = []
-        for match in WORD_REGEXP.finditer(self.clean_text_):
-            token_dict = match.groupdict()
-            for token_type in tokens_types:
-                if token_dict[token_type] is not None:
-                    if detect_punctuation:
-                        if token_dict[token_type] in PUNCTUATION:
-                            self.tokens_.append((token_dict[token_type], 'punctuation'))
-                            break
-                    if stopwords_list is not None:
-                        if token_dict[token_type] in stopwords_list:
-                            self.tokens_.append((token_dict[token_type], 'stopword'))
-                            break
-                    if specify_url_type and token_type == 'url':
-                        found = False
-                        for url_type in SPECIFIC_URLS:
-                            if url_type in token_dict[token_type]:
-                                self.tokens_.append((token_dict[token_type], token_type + '_' + '_'.join(url_type.split('.'))))
-                                found =True
-                                break
-                        if found:
-                            break
-                    self.tokens_.append((token_dict[token_type], token_type))
-                    break
+        for match in word_regexp().finditer(normalized_text):
+            token = match.group()
+            token_type = match.lastgroup
+            if detect_punctuation and token in PUNCTUATION:
+                yield token, 'punctuation'
+            elif stopwords_list is not None and token in stopwords_list:
+                yield token, 'stopword'
+            elif specify_url_type and token_type == 'url':
+                for url_type in SPECIFIC_URLS:
+                    if url_type in token:
+                        yield token, token_type + '_' + '_'.join(url_type.split('.'))
+                        break
+                else:
+                    yield token, token_type
+            else:
+                yield token, token_type
 
-    def process_text(self):
-        rules = {
+    def rules(self):
+        return {
             'token': self.token,
             'mention': self.mention,
             'hashtag': self.hashtag,
@@ -160,8 +180,11 @@ class SocialMediaTokenizer():
             'emoji': self.emoji,
             'stopword':self.stopwords
         }
+
+    @staticmethod
+    def apply_rules(tokens, rules):
         processed_tokens = []
-        for (tk, tk_name) in self.tokens_:
+        for (tk, tk_name) in tokens:
             rule = rules[tk_name] if tk_name in rules else rules['url']
             if rule == 'remove':
                 pass
@@ -176,4 +199,35 @@ class SocialMediaTokenizer():
                     ValueError("Strip mode just for hashtags and mentions")
             else:
                 ValueError("Rule should be either remove, keep, replace and strip")
-        self.clean_text_ = ' '.join(processed_tokens)
\ No newline at end of file
+        return ' '.join(processed_tokens)
+
+    def tokenize(self):
+        self.tokens_ = list(self.iter_tokens(self.clean_text_))
+
+    def process_text(self):
+        self.clean_text_ = self.apply_rules(self.tokens_, self.rules())
+
+    def process(self, text):
+        return self.apply_rules(self.iter_tokens(self.normalize_text(text)), self.rules())
+
+    def process_batch(self, texts):
+        """
+        Clean text of each document, the tokenizer configuration is shared by the whole batch.
+        """
+        rules = self.rules()
+        return [self.apply_rules(self.iter_tokens(self.normalize_text(text)), rules) for text in texts]
+
+    def tokenize_batch(self, texts):
+        """
+        Flat tokens and tokens types of all documents, tokens of document i are
+        tokens[offsets[i]:offsets[i + 1]].
+        """
+        tokens = []
+        offsets = [0]
+        for text in texts:
+            tokens.extend(self.iter_tokens(self.normalize_text(text)))
+            offsets.append(len(tokens))
+        tokens_array = np.empty(len(tokens), dtype=object)
+        tokens_array[:] = [tk for tk, _ in tokens]
+        types_array = np.array([tk_name for _, tk_name in tokens], dtype=object)
+        return tokens_array, types_array, np.array(offsets)
@@ -0,0 +1,135 @@
+import re
+import string
+from functools import lru_cache
+from importlib import resources
+import numpy as np
+import pandas as pd
+from pyphen import Pyphen
+
+# Same formulas and tokenization as textstat 0.7, computed from counts shared by all metrics
+READABILITY_METRICS = ['flesch_reading_ease', 'flesch_kincaid_grade', 'coleman_liau_index',
+                       'automated_readability_index', 'dale_chall_readability_score', 'difficult_words',
+                       'linsear_write_formula', 'gunning_fog']
+PUNCTUATION_REGEXP = re.compile(f'[{re.escape(string.punctuation)}]')
+SENTENCES_SPLIT_REGEXP = re.compile(r' *[\.\?!][\'"\)\]]*[ |\n](?=[A-Z])')
+DIFFICULT_WORD_REGEXP = re.compile(r"[\w\='‘’]+")
+DIFFICULT_WORD_SYLLABLES = 2
+GUNNING_FOG_SYLLABLES = 3
+LINSEAR_WRITE_NB_WORDS = 100
+SYLLABLES_CACHE_SIZE = 2**20
+
+@lru_cache(maxsize=1)
+def hyphenator():
+    return Pyphen(lang='en_US')
+
+@lru_cache(maxsize=1)
+def easy_words():
+    easy_words_file = resources.files('textstat').joinpath('resources', 'en', 'easy_words.txt')
+    return {line.strip() for line in easy_words_file.read_text(encoding='utf-8').splitlines()}
+
+@lru_cache(maxsize=SYLLABLES_CACHE_SIZE)
+def word_syllables(word):
+    """
+    Syllables of a lowercased word without punctuation, cached for the whole corpus.
+    """
+    return len(hyphenator().positions(word)) + 1
+
+def remove_punctuation(text):
+    return PUNCTUATION_REGEXP.sub('', text)
+
+def lexicon_count(text):
+    return len(remove_punctuation(text).split())
+
+def sentence_count(text):
+    sentences = SENTENCES_SPLIT_REGEXP.split(text)
+    nb_ignored = sum(1 for sentence in sentences if lexicon_count(sentence) <= 2)
+    return max(1, len(sentences) - nb_ignored)
+
+def single_word_syllables(word):
+    word = remove_punctuation(word.lower())
+    return word_syllables(word) if word else 0
+
+def text_counts(text):
+    text_without_punctuation = remove_punctuation(text)
+    text_without_spaces = text.replace(' ', '')
+    lowered_text = text_without_punctuation.lower()
+    syllables = sum(word_syllables(word) for word in lowered_text.split(' ')) if lowered_text else 0
+
+    nb_difficult_words = 0
+    nb_fog_difficult_words = 0
+    easy_words_set = easy_words()
+    for word in set(DIFFICULT_WORD_REGEXP.findall(text.lower())):
+        if word not in easy_words_set:
+            syllables_word = single_word_syllables(word)
+            nb_difficult_words += syllables_word >= DIFFICULT_WORD_SYLLABLES
+            nb_fog_difficult_words += syllables_word >= GUNNING_FOG_SYLLABLES
+
+    linsear_words = text.split()[:LINSEAR_WRITE_NB_WORDS]
+    linsear_points = sum(1 if single_word_syllables(word) < 3 else 3 for word in linsear_words)
+
+    return [len(text_without_spaces),
+            len(remove_punctuation(text_without_spaces)),
+            len(text_without_punctuation.split()),
+            syllables,
+            sentence_count(text),
+            nb_difficult_words,
+            nb_fog_difficult_words,
+            linsear_points,
+            sentence_count(' '.join(linsear_words))]
+
+def legacy_round(values, points=0):
+    p = 10 ** points
+    return np.floor(values * p + np.copysign(0.5, values)) / p
+
+def readability_columns(texts):
+    """
+    The eight readability metrics of every text, as a dict of float arrays (difficult_words is an int).
+    """
+    counts = np.array([text_counts(text) for text in texts], dtype=float).reshape(len(texts), 9)
+    chars, letters, words, syllables, sentences, difficult_words, fog_difficult_words, linsear_points, \
+        linsear_sentences = counts.T
+    has_words = words > 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sentence_length = legacy_round(words / sentences, 1)
+        syllables_per_word = np.where(has_words, legacy_round(syllables / words, 1), 0.)
+        letters_per_word = np.where(has_words, legacy_round(letters / words, 2), 0.)
+        sentences_per_word = np.where(has_words, legacy_round(sentences / words, 2), 0.)
+
+        flesch_reading_ease = legacy_round(206.835 - 1.015 * sentence_length - 84.6 * syllables_per_word, 2)
+        flesch_kincaid_grade = legacy_round(0.39 * sentence_length + 11.8 * syllables_per_word - 15.59, 1)
+        coleman_liau_index = legacy_round(0.058 * legacy_round(letters_per_word * 100, 2) -
+                                          0.296 * legacy_round(sentences_per_word * 100, 2) - 15.8, 2)
+        automated_readability_index = np.where(
+            has_words,
+            legacy_round(4.71 * legacy_round(chars / words, 2) + 0.5 * legacy_round(words / sentences, 2) - 21.43, 1),
+            0.)
+
+        percentage_difficult_words = 100 - (words - difficult_words) / words * 100
+        dale_chall_readability_score = 0.1579 * percentage_difficult_words + 0.0496 * sentence_length
+        dale_chall_readability_score += np.where(percentage_difficult_words > 5, 3.6365, 0.)
+        dale_chall_readability_score = np.where(has_words, legacy_round(dale_chall_readability_score, 2), 0.)
+
+        linsear_write_formula = linsear_points / linsear_sentences
+        linsear_write_formula = np.where(linsear_write_formula <= 20, linsear_write_formula - 2,
+                                         linsear_write_formula) / 2
+
+        gunning_fog = np.where(
+            has_words, legacy_round(0.4 * (sentence_length + fog_difficult_words / words * 100), 2), 0.)
+
+    return {
+        'flesch_reading_ease': flesch_reading_ease,
+        'flesch_kincaid_grade': flesch_kincaid_grade,
+        'coleman_liau_index': coleman_liau_index,
+        'automated_readability_index': automated_readability_index,
+        'dale_chall_readability_score': dale_chall_readability_score,
+        'difficult_words': difficult_words.astype(int),
+        'linsear_write_formula': linsear_write_formula,
+        'gunning_fog': gunning_fog
+    }
+
+def readability_metrics(text_serie):
+    """
+    The eight readability metrics of every text, as float columns (difficult_words is an int).
+    """
+    return pd.DataFrame(readability_columns(text_serie), index=text_serie.index)